@@ -3,12 +3,14 @@ import sys
 import threading
 from mylib.centroidtracker import CentroidTracker
 from mylib.trackableobject import TrackableObject
+from mylib.postprocess import decode_detections
+from mylib.detector import BACKENDS, load_net, select_backend
+from mylib.jpegcache import JpegCache
 from imutils.video import VideoStream
 from imutils.video import FPS
 from mylib.mailer import Mailer
 from mylib import config, thread
 import time, schedule, csv
-import numpy as np
 import argparse, imutils
 import time, dlib, cv2, datetime
 from itertools import zip_longest
@@ -19,8 +21,9 @@ from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 
-# Global variable to store the current frame
-output_frame = None
+# The latest frame, encoded once and shared by every viewer
+frames = JpegCache()
+detector_info = {}
 video_thread = None
 stop_event = threading.Event()
 
@@ -32,7 +35,7 @@ totalDown = 0
 t0 = time.time()
 
 def run():
-    global output_frame, totalDown, totalUp
+    global totalDown, totalUp
 
     # construct the argument parse and parse the arguments
     ap = argparse.ArgumentParser()
@@ -49,19 +52,15 @@ def run():
                     help="minimum probability to filter weak detections")
     ap.add_argument("-s", "--skip-frames", type=int, default=30,
                     help="# of skip frames between detections")
+    ap.add_argument("-k", "--backend", default="auto", choices=["auto"] + list(BACKENDS),
+                    help="OpenCV DNN backend, 'auto' benchmarks them on example.png")
     args = vars(ap.parse_args())
 
-    # initialize the list of class labels MobileNet SSD was trained to detect
-    CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
-               "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
-               "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
-               "sofa", "train", "tvmonitor"]
-
-    # load our serialized model from disk
-    net = cv2.dnn.readNetFromCaffe(args["prototxt"], args["model"])
-
-    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+    # pick the fastest available backend (unless one was requested) and load our serialized model from disk
+    (backend, benchmark) = select_backend(args["model"], args["prototxt"], args["backend"])
+    net = load_net(args["model"], args["prototxt"], backend)
+    detector_info.update(backend=backend, benchmark=benchmark)
+    print("[INFO] using the {} backend".format(backend))
 
     # if a video path was not supplied, grab a reference to the ip camera
     if not args.get("input", False):
@@ -138,31 +137,18 @@ def run():
             net.setInput(blob)
             detections = net.forward()
 
-            # loop over the detections
-            for i in np.arange(0, detections.shape[2]):
-                # extract the confidence (i.e., probability) associated with the prediction
-                confidence = detections[0, 0, i, 2]
-
-                # filter out weak detections by requiring a minimum confidence
-                if confidence > args["confidence"]:
-                    # extract the index of the class label from the detections list
-                    idx = int(detections[0, 0, i, 1])
-
-                    # if the class label is not a person, ignore it
-                    if CLASSES[idx] != "person":
-                        continue
-
-                    # compute the (x, y)-coordinates of the bounding box for the object
-                    box = detections[0, 0, i, 3:7] * np.array([W, H, W, H])
-                    (startX, startY, endX, endY) = box.astype("int")
+            # filter, scale and clip the person detections in one pass
+            boxes = decode_detections(detections, W, H, args["confidence"])
 
-                    # construct a dlib rectangle object from the bounding box coordinates and then start the dlib correlation tracker
-                    tracker = dlib.correlation_tracker()
-                    rect = dlib.rectangle(startX, startY, endX, endY)
-                    tracker.start_track(rgb, rect)
+            # loop over the detections
+            for (startX, startY, endX, endY) in boxes:
+                # construct a dlib rectangle object from the bounding box coordinates and then start the dlib correlation tracker
+                tracker = dlib.correlation_tracker()
+                rect = dlib.rectangle(int(startX), int(startY), int(endX), int(endY))
+                tracker.start_track(rgb, rect)
 
-                    # add the tracker to our list of trackers so we can utilize it during skip frames
-                    trackers.append(tracker)
+                # add the tracker to our list of trackers so we can utilize it during skip frames
+                trackers.append(tracker)
 
         # otherwise, we should utilize our object *trackers* rather than object *detectors* to obtain a higher frame processing throughput
         else:
@@ -186,12 +172,16 @@ def run():
 
         # draw a horizontal line in the center of the frame -- once an object crosses this line we will determine whether they were moving 'up' or 'down'
         cv2.line(frame, (0, H // 2), (W, H // 2), (0, 0, 0), 3)
-        cv2.putText(frame, "-Prediction border - Entrance-", (10, H - ((i * 20) + 200)),
+        cv2.putText(frame, "-Prediction border - Entrance-", (10, H - 200),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
 
         # use the centroid tracker to associate the (1) old object centroids with (2) the newly computed object centroids
         objects = ct.update(rects)
 
+        # drop the trackable objects of the IDs the centroid tracker deregistered
+        for objectID in ct.deregistered:
+            trackableObjects.pop(objectID, None)
+
         # loop over the tracked objects
         for (objectID, centroid) in objects.items():
             # check to see if a trackable object exists for the current object ID
@@ -204,9 +194,8 @@ def run():
             # otherwise, there is a trackable object so we can utilize it to determine direction
             else:
                 # the difference between the y-coordinate of the *current* centroid and the mean of *previous* centroids will tell us in which direction the object is moving (negative for 'up' and positive for 'down')
-                y = [c[1] for c in to.centroids]
-                direction = centroid[1] - np.mean(y)
-                to.centroids.append(centroid)
+                direction = centroid[1] - to.meanY
+                to.append(centroid)
 
                 # check to see if the object has been counted or not
                 if not to.counted:
@@ -260,7 +249,7 @@ def run():
 
         # show the output frame
         cv2.imshow("Frame", frame)
-        output_frame = frame.copy()
+        frames.publish("default", frame)
         key = cv2.waitKey(1) & 0xFF
 
         # if the `q` key was pressed, break from the loop
@@ -292,19 +281,29 @@ def run():
     cv2.destroyAllWindows()
 
 def generate():
-    global output_frame
-    while not stop_event.is_set():
-        if output_frame is None:
-            continue
-        (flag, encodedImage) = cv2.imencode(".jpg", output_frame)
-        if not flag:
-            continue
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + bytearray(encodedImage) + b'\r\n')
+    # block until a new frame is published instead of spinning
+    return frames.stream("default", stop_event)
 
 @app.route('/video_feed')
 def video_feed():
     return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
+@app.route('/snapshot')
+def snapshot():
+    return snapshot_response(frames.slot("default"))
+
+def snapshot_response(slot):
+    # the cached JPEG of the latest frame, 304 if the client has it already
+    frame = slot.get()
+    if frame is None:
+        return jsonify({'error': 'No frame yet'}), 503
+    (version, timestamp, data) = frame
+    etag = slot.etag(version)
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(data, mimetype='image/jpeg',
+                    headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
 @app.route('/count')
 def get_count():
     global totalUp, totalDown, totalInside
@@ -314,6 +313,10 @@ def get_count():
         'inside': totalDown - totalUp
     })
 
+@app.route('/detector')
+def get_detector():
+    return jsonify(detector_info)
+
 @app.route('/shutdown', methods=['POST'])
 def shutdown():
     stop_event.set()
@@ -0,0 +1,356 @@
+from mylib.postprocess import CLASSES, decode_detections
+from mylib.trackerpool import TrackerPool
+from mylib.centroidtracker import CentroidTracker
+from mylib.trackableobject import TrackableObject
+from mylib.framepipeline import FramePipeline
+from mylib.linecounter import CountingLines
+from mylib.capture import SyntheticSource
+from mylib.detector import load_net
+import numpy as np
+import argparse, timeit, time, cv2, os
+
+# Micro-benchmarks for the people counter pipeline stages, e.g.
+# python benchmark.py decode --detections 100
+
+def make_detections(n, seed=42):
+    # build a raw SSD output of shape (1, 1, n, 7) with random classes,
+    # confidences and normalized boxes
+    rng = np.random.default_rng(seed)
+    detections = np.zeros((1, 1, n, 7), dtype="float32")
+    detections[0, 0, :, 1] = rng.integers(0, len(CLASSES), n)
+    detections[0, 0, :, 2] = rng.random(n)
+    xy = rng.random((n, 2)) * 0.8
+    wh = rng.random((n, 2)) * 0.2
+    detections[0, 0, :, 3:5] = xy
+    detections[0, 0, :, 5:7] = xy + wh
+    return detections
+
+def decode_loop(detections, W, H, confidence):
+    # the original per-row loop used by the pipelines
+    boxes = []
+    for i in np.arange(0, detections.shape[2]):
+        if detections[0, 0, i, 2] > confidence:
+            idx = int(detections[0, 0, i, 1])
+            if CLASSES[idx] != "person":
+                continue
+            box = detections[0, 0, i, 3:7] * np.array([W, H, W, H])
+            boxes.append(box.astype("int"))
+    return boxes
+
+def bench_decode(args):
+    detections = make_detections(args["detections"])
+    (W, H) = (500, 375)
+
+    loop = timeit.timeit(lambda: decode_loop(detections, W, H, 0.4), number=args["number"])
+    vect = timeit.timeit(lambda: decode_detections(detections, W, H, 0.4), number=args["number"])
+    nms = timeit.timeit(lambda: decode_detections(detections, W, H, 0.4, overlapThresh=0.3),
+                        number=args["number"])
+
+    print("[INFO] {} raw detections, {} runs".format(args["detections"], args["number"]))
+    print("[INFO] python loop:      {:.2f} us/frame".format(loop / args["number"] * 1e6))
+    print("[INFO] vectorized:       {:.2f} us/frame ({:.1f}x)".format(vect / args["number"] * 1e6, loop / vect))
+    print("[INFO] vectorized + NMS: {:.2f} us/frame".format(nms / args["number"] * 1e6))
+
+def bench_trackers(args):
+    import dlib
+
+    # a textured frame that shifts by a pixel per update gives the
+    # correlation trackers something to follow
+    rng = np.random.default_rng(42)
+    frames = [np.ascontiguousarray(np.roll(rng.integers(0, 256, (375, 500, 3), dtype="uint8"), i, axis=1))
+              for i in range(2)]
+
+    for n in args["trackers"]:
+        for workers in args["workers"]:
+            trackers = []
+            for i in range(n):
+                (x, y) = (int(rng.integers(0, 440)), int(rng.integers(0, 255)))
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(frames[0], dlib.rectangle(x, y, x + 50, y + 110))
+                trackers.append(tracker)
+
+            pool = TrackerPool(workers)
+            start = time.time()
+            for i in range(args["number"]):
+                pool.update(trackers, frames[i % 2])
+            elapsed = (time.time() - start) / args["number"]
+            pool.shutdown()
+
+            print("[INFO] {:>4} trackers, {:>2} workers: {:.2f} ms/frame".format(n, workers, elapsed * 1000))
+
+def make_scene(n, frames, seed=42):
+    # simulate n people walking across a frame big enough to keep their
+    # density constant, with a few missed detections every frame
+    rng = np.random.default_rng(seed)
+    side = 100.0 * np.sqrt(n)
+    pos = rng.random((n, 2)) * side
+    vel = rng.normal(0, 3, (n, 2))
+    scene = []
+    for i in range(frames):
+        pos += vel + rng.normal(0, 1, (n, 2))
+        seen = pos[rng.random(n) > 0.05]
+        scene.append(np.hstack([seen, seen + [30, 80]]).astype("int"))
+    return scene
+
+def bench_centroid(args):
+    for n in args["objects"]:
+        scene = make_scene(n, args["number"])
+        for matching in ("greedy", "hungarian"):
+            for (index, threshold) in (("dense", None), ("grid", 0)):
+                ct = CentroidTracker(maxDisappeared=40, maxDistance=50, matching=matching,
+                                     gridThreshold=threshold)
+                start = time.time()
+                for rects in scene:
+                    ct.update(rects)
+                elapsed = (time.time() - start) / args["number"]
+                print("[INFO] {:>5} objects, {:>9}, {:>5}: {:.3f} ms/frame, {} IDs".format(
+                    n, matching, index, elapsed * 1000, ct.nextObjectID))
+
+def rss_mb():
+    # the resident set size of this process (Linux only, 0 elsewhere)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0.0
+
+def bench_soak(args):
+    import tracemalloc
+
+    # people walk down a 500x375 frame at their own pace, and every one
+    # that leaves at the bottom is replaced by a new one at the top
+    rng = np.random.default_rng(42)
+    (W, H) = (500, 375)
+    pos = rng.random((args["people"], 2)) * [W, H]
+    speed = rng.uniform(1, 4, args["people"])
+
+    ct = CentroidTracker(maxDisappeared=40, maxDistance=50)
+    trackableObjects = {}
+    (totalUp, totalDown) = (0, 0)
+
+    # tracing every allocation slows the loop down several times, so the
+    # Python heap is only traced on request
+    if args["tracemalloc"]:
+        tracemalloc.start()
+    start = time.time()
+    for frame in range(1, args["frames"] + 1):
+        pos[:, 1] += speed
+        gone = pos[:, 1] > H
+        pos[gone] = np.column_stack([rng.random(gone.sum()) * W, np.zeros(gone.sum())])
+        rects = np.hstack([pos - [15, 40], pos + [15, 40]]).astype("int")
+
+        objects = ct.update(rects)
+        if not args["no_evict"]:
+            for objectID in ct.deregistered:
+                trackableObjects.pop(objectID, None)
+
+        for (objectID, centroid) in objects.items():
+            to = trackableObjects.get(objectID, None)
+            if to is None:
+                to = TrackableObject(objectID, centroid)
+            else:
+                direction = centroid[1] - to.meanY
+                to.append(centroid)
+                if not to.counted and direction < 0 and centroid[1] < H // 2:
+                    totalUp += 1
+                    to.counted = True
+                elif not to.counted and direction > 0 and centroid[1] > H // 2:
+                    totalDown += 1
+                    to.counted = True
+            trackableObjects[objectID] = to
+
+        # memory should stay flat once the first people have left
+        if frame % args["every"] == 0:
+            traced = ""
+            if tracemalloc.is_tracing():
+                (current, peak) = tracemalloc.get_traced_memory()
+                traced = ", heap {:.2f} MB (peak {:.2f} MB)".format(current / 2 ** 20, peak / 2 ** 20)
+            print("[INFO] {:>9} frames, {:>8} IDs, {:>4} trackable objects, RSS {:.1f} MB{}, {:.0f} frames/s".format(
+                frame, ct.nextObjectID, len(trackableObjects), rss_mb(), traced,
+                frame / (time.time() - start)))
+
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    print("[INFO] entered {}, exited {}".format(totalDown, totalUp))
+
+def synthetic_boxes(source, scale):
+    # the boxes of the people of the last synthetic frame that are in
+    # view, scaled to the processing frame
+    (width, height) = source.size
+    (th, tw) = source.texture.shape[:2]
+    x = np.minimum(source.pos[:, 0], width - tw)
+    y = source.pos[:, 1]
+    boxes = np.column_stack([x, np.maximum(y - th, 0), x + tw, np.minimum(y, height)])
+    return boxes[boxes[:, 3] > boxes[:, 1] + th // 2] * scale
+
+def synthetic_truth(frames, W, H):
+    # the number of people whose centroid walks down across the middle of
+    # the processing frame in the given number of synthetic frames
+    source = SyntheticSource(fps=0)
+    (width, height) = source.size
+    scale = W / float(width)
+    th = source.texture.shape[0]
+    entered = 0
+    for i in range(frames):
+        before = source.pos[:, 1].copy()
+        source.grab()
+        after = source.pos[:, 1]
+        (y0, y1) = ((before - th / 2.0) * scale, (after - th / 2.0) * scale)
+        entered += int(((after > before) & (y0 < H / 2.0) & (y1 >= H / 2.0)).sum())
+    return (entered, 0)
+
+def count_video(source, detect, engine, frames=None, skipFrames=30):
+    # run a video through detection, the given tracking engine, the
+    # centroid tracker and the counting line the cameras use, and return
+    # the counts and tracking time
+    pipeline = FramePipeline(width=500)
+    ct = CentroidTracker(maxDisappeared=40, maxDistance=50)
+    lines = None
+    (count, tracking) = (0, 0.0)
+
+    while frames is None or count < frames:
+        (grabbed, raw) = source.read()
+        if not grabbed:
+            break
+
+        frame = pipeline.process(raw)
+        if lines is None:
+            (H, W) = frame.shape[:2]
+            lines = CountingLines(None, W, H)
+
+        if count % skipFrames == 0:
+            boxes = detect(frame)
+            start = time.time()
+            rects = engine.detect(boxes, pipeline)
+        else:
+            start = time.time()
+            (rects, psrs) = engine.track(pipeline)
+        tracking += time.time() - start
+
+        ct.update(rects)
+        (objectIDs, centroids) = ct.tracks()
+        lines.update(objectIDs, centroids)
+        count += 1
+
+    source.release()
+    (entered, exited) = lines.totals() if lines is not None else (0, 0)
+    return (entered, exited, count, tracking)
+
+def bench_engines(args):
+    from mylib.kalmantracker import KalmanTrackerEngine
+
+    # the dlib engine is only compared where dlib is installed
+    try:
+        from mylib.trackerengine import make_engine
+        names = ("dlib", "kalman")
+    except ImportError:
+        print("[INFO] dlib is not installed, only the kalman engine is run")
+        (make_engine, names) = (None, ("kalman",))
+    pool = TrackerPool(args["workers"])
+
+    # recorded footage is detected with the network and compared with the
+    # given counts, a synthetic scene is "detected" from its true boxes
+    # (with a few pixels of noise and 5% of the people missed) and
+    # compared with the people that really crossed the line
+    if args["synthetic"]:
+        (W, H) = (500, 375)
+        expected = synthetic_truth(args["synthetic"], W, H)
+    else:
+        net = load_net(args["model"], args["prototxt"])
+        expected = (args["expected_in"], args["expected_out"])
+
+    for name in names:
+        engine = make_engine(name, pool) if make_engine is not None else KalmanTrackerEngine()
+        if args["synthetic"]:
+            source = SyntheticSource(fps=0)
+            rng = np.random.default_rng(7)
+            def detect(frame):
+                boxes = synthetic_boxes(source, frame.shape[1] / float(source.size[0]))
+                boxes = boxes[rng.random(len(boxes)) > 0.05]
+                return (boxes + rng.normal(0, 2, boxes.shape)).astype("int")
+        else:
+            source = cv2.VideoCapture(args["input"])
+            def detect(frame):
+                (H, W) = frame.shape[:2]
+                net.setInput(cv2.dnn.blobFromImage(frame, 0.007843, (W, H), 127.5))
+                return decode_detections(net.forward(), W, H, args["confidence"])
+
+        (entered, exited, frames, tracking) = count_video(source, detect, engine,
+            args["synthetic"] or None, args["skip_frames"])
+        print("[INFO] {:>6}: entered {}, exited {}, {:.0f} tracked frames/s ({:.2f} ms/frame)".format(
+            name, entered, exited, frames / max(tracking, 1e-9), tracking / max(frames, 1) * 1000))
+
+        # the counting error against the expected counts, where known
+        if None not in expected:
+            (expectedIn, expectedOut) = expected
+            error = abs(entered - expectedIn) + abs(exited - expectedOut)
+            print("[INFO] {:>6}: expected entered {}, exited {}, error {} ({:.1f}%)".format(
+                name, expectedIn, expectedOut, error,
+                100.0 * error / max(expectedIn + expectedOut, 1)))
+
+    pool.shutdown()
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("decode", help="detection post-processing")
+    p.add_argument("-d", "--detections", type=int, default=100,
+                   help="# of raw detections per frame")
+    p.add_argument("-n", "--number", type=int, default=10000,
+                   help="# of timed runs")
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("trackers", help="dlib tracker updates on the worker pool")
+    p.add_argument("-t", "--trackers", type=int, nargs="+", default=[1, 10, 50, 100],
+                   help="# of trackers per frame")
+    p.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                   help="# of worker threads")
+    p.add_argument("-n", "--number", type=int, default=50,
+                   help="# of timed frames")
+    p.set_defaults(func=bench_trackers)
+
+    p = sub.add_parser("centroid", help="centroid tracker matching on a synthetic crowd")
+    p.add_argument("-o", "--objects", type=int, nargs="+", default=[10, 100, 500, 1000],
+                   help="# of people in the scene")
+    p.add_argument("-n", "--number", type=int, default=200,
+                   help="# of timed frames")
+    p.set_defaults(func=bench_centroid)
+
+    p = sub.add_parser("soak", help="memory of the counting loop on a long synthetic stream")
+    p.add_argument("-f", "--frames", type=int, default=10000000,
+                   help="# of frames to run")
+    p.add_argument("-p", "--people", type=int, default=10,
+                   help="# of people in the frame at any time")
+    p.add_argument("-e", "--every", type=int, default=100000,
+                   help="# of frames between memory reports")
+    p.add_argument("--no-evict", action="store_true",
+                   help="keep the trackable objects of deregistered IDs")
+    p.add_argument("--tracemalloc", action="store_true",
+                   help="also report the traced Python heap (much slower)")
+    p.set_defaults(func=bench_soak)
+
+    p = sub.add_parser("engines", help="dlib vs. Kalman tracking engines on recorded or synthetic footage")
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument("-i", "--input",
+                        help="path to the recorded video")
+    source.add_argument("--synthetic", type=int,
+                        help="# of frames of a synthetic scene with known counts")
+    p.add_argument("--expected-in", type=int, default=None,
+                   help="# of people that really entered the recorded video")
+    p.add_argument("--expected-out", type=int, default=None,
+                   help="# of people that really exited the recorded video")
+    p.add_argument("-p", "--prototxt", default="./mobilenet_ssd/MobileNetSSD_deploy.prototxt",
+                   help="path to Caffe 'deploy' prototxt file")
+    p.add_argument("-m", "--model", default="./mobilenet_ssd/MobileNetSSD_deploy.caffemodel",
+                   help="path to Caffe pre-trained model or ONNX model")
+    p.add_argument("-c", "--confidence", type=float, default=0.4,
+                   help="minimum probability to filter weak detections")
+    p.add_argument("-s", "--skip-frames", type=int, default=30,
+                   help="# of skip frames between detections")
+    p.add_argument("-w", "--workers", type=int, default=4,
+                   help="# of threads updating the dlib trackers")
+    p.set_defaults(func=bench_engines)
+
+    args = vars(ap.parse_args())
+    args["func"](args)
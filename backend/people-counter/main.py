@@ -1,11 +1,12 @@
 from mylib.centroidtracker import CentroidTracker
 from mylib.trackableobject import TrackableObject
+from mylib.postprocess import decode_detections
+from mylib.detector import BACKENDS, load_net, select_backend
 from imutils.video import VideoStream
 from imutils.video import FPS
 from mylib.mailer import Mailer
 from mylib import config, thread
 import time, schedule, csv
-import numpy as np
 import argparse, imutils
 import time, dlib, cv2, datetime
 from itertools import zip_longest
@@ -32,20 +33,17 @@ def run():
 		help="minimum probability to filter weak detections")
 	ap.add_argument("-s", "--skip-frames", type=int, default=30,
 		help="# of skip frames between detections")
+	ap.add_argument("-k", "--backend", default="auto", choices=["auto"] + list(BACKENDS),
+		help="OpenCV DNN backend, 'auto' benchmarks them on example.png")
 	args = vars(ap.parse_args())
 
-	# initialize the list of class labels MobileNet SSD was trained to
-	# detect
-	CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
-		"bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
-		"dog", "horse", "motorbike", "person", "pottedplant", "sheep",
-		"sofa", "train", "tvmonitor"]
-
+	# pick the fastest available backend (unless one was requested) and
 	# load our serialized model from disk
-	net = cv2.dnn.readNetFromCaffe(args["prototxt"], args["model"])
-
-	net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-	net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+	(backend, benchmark) = select_backend(args["model"], args["prototxt"], args["backend"])
+	net = load_net(args["model"], args["prototxt"], backend)
+	for r in benchmark:
+		print("[INFO] {}: {:.2f} ms".format(r["backend"], r["latency_ms"]))
+	print("[INFO] using the {} backend".format(backend))
 
 	# if a video path was not supplied, grab a reference to the ip camera
 	if not args.get("input", False):
@@ -136,39 +134,21 @@ def run():
 			net.setInput(blob)
 			detections = net.forward()
 
+			# filter, scale and clip the person detections in one pass
+			boxes = decode_detections(detections, W, H, args["confidence"])
+
 			# loop over the detections
-			for i in np.arange(0, detections.shape[2]):
-				# extract the confidence (i.e., probability) associated
-				# with the prediction
-				confidence = detections[0, 0, i, 2]
-
-				# filter out weak detections by requiring a minimum
-				# confidence
-				if confidence > args["confidence"]:
-					# extract the index of the class label from the
-					# detections list
-					idx = int(detections[0, 0, i, 1])
-
-					# if the class label is not a person, ignore it
-					if CLASSES[idx] != "person":
-						continue
-
-					# compute the (x, y)-coordinates of the bounding box
-					# for the object
-					box = detections[0, 0, i, 3:7] * np.array([W, H, W, H])
-					(startX, startY, endX, endY) = box.astype("int")
-
-
-					# construct a dlib rectangle object from the bounding
-					# box coordinates and then start the dlib correlation
-					# tracker
-					tracker = dlib.correlation_tracker()
-					rect = dlib.rectangle(startX, startY, endX, endY)
-					tracker.start_track(rgb, rect)
-
-					# add the tracker to our list of trackers so we can
-					# utilize it during skip frames
-					trackers.append(tracker)
+			for (startX, startY, endX, endY) in boxes:
+				# construct a dlib rectangle object from the bounding
+				# box coordinates and then start the dlib correlation
+				# tracker
+				tracker = dlib.correlation_tracker()
+				rect = dlib.rectangle(int(startX), int(startY), int(endX), int(endY))
+				tracker.start_track(rgb, rect)
+
+				# add the tracker to our list of trackers so we can
+				# utilize it during skip frames
+				trackers.append(tracker)
 
 		# otherwise, we should utilize our object *trackers* rather than
 		# object *detectors* to obtain a higher frame processing throughput
@@ -196,13 +176,18 @@ def run():
 		# object crosses this line we will determine whether they were
 		# moving 'up' or 'down'
 		cv2.line(frame, (0, H // 2), (W, H // 2), (0, 0, 0), 3)
-		cv2.putText(frame, "-Prediction border - Entrance-", (10, H - ((i * 20) + 200)),
+		cv2.putText(frame, "-Prediction border - Entrance-", (10, H - 200),
 			cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
 
 		# use the centroid tracker to associate the (1) old object
 		# centroids with (2) the newly computed object centroids
 		objects = ct.update(rects)
 
+		# drop the trackable objects of the IDs the centroid tracker
+		# deregistered so they do not pile up
+		for objectID in ct.deregistered:
+			trackableObjects.pop(objectID, None)
+
 		# loop over the tracked objects
 		for (objectID, centroid) in objects.items():
 			# check to see if a trackable object exists for the current
@@ -220,9 +205,8 @@ def run():
 				# centroid and the mean of *previous* centroids will tell
 				# us in which direction the object is moving (negative for
 				# 'up' and positive for 'down')
-				y = [c[1] for c in to.centroids]
-				direction = centroid[1] - np.mean(y)
-				to.centroids.append(centroid)
+				direction = centroid[1] - to.meanY
+				to.append(centroid)
 
 				# check to see if the object has been counted or not
 				if not to.counted:
@@ -0,0 +1,265 @@
+# import the necessary packages
+from collections import namedtuple
+import threading
+import time
+import numpy as np
+import cv2
+
+# a captured frame along with its sequence number (counting every frame
+# read from the source) and the time it was read
+CapturedFrame = namedtuple("CapturedFrame", ["seq", "timestamp", "image"])
+
+class SyntheticSource:
+
+	"""
+	A stand-in camera for testing without hardware: textured "people"
+	walking down a noisy background, paced at the given frame rate.
+	Opened with a source such as "synthetic:640x480@25".
+
+	"""
+	def __init__(self, width=640, height=480, fps=25.0, people=8, seed=42):
+		self.size = (width, height)
+		self.interval = 1.0 / fps if fps > 0 else 0.0
+		self.rng = np.random.default_rng(seed)
+		self.background = self.rng.integers(60, 120, (height, width, 3), dtype="uint8")
+		self.texture = self.rng.integers(0, 255, (height // 6, width // 20, 3), dtype="uint8")
+		self.pos = self.rng.random((people, 2)) * [width, height]
+		self.speed = self.rng.uniform(1, 4, people)
+		self.next = time.time()
+
+	def isOpened(self):
+		return True
+
+	def grab(self):
+		# wait for the next frame slot, then move the people
+		delay = self.next - time.time()
+		if delay > 0:
+			time.sleep(delay)
+		self.next = max(self.next + self.interval, time.time() - self.interval)
+		(th, height) = (self.texture.shape[0], self.size[1])
+		self.pos[:, 1] = (self.pos[:, 1] + self.speed) % (height + th)
+		return True
+
+	def retrieve(self):
+		# draw the people of the last grabbed frame
+		(width, height) = self.size
+		(th, tw) = self.texture.shape[:2]
+		frame = self.background.copy()
+		for (x, y) in self.pos.astype("int"):
+			(x, y) = (min(x, width - tw), y - th)
+			(top, bottom) = (max(y, 0), min(y + th, height))
+			if bottom > top:
+				frame[top:bottom, x:x + tw] = self.texture[top - y:bottom - y]
+		return (True, frame)
+
+	def read(self):
+		self.grab()
+		return self.retrieve()
+
+	def set(self, prop, value):
+		return False
+
+	def get(self, prop):
+		return 1.0 / self.interval if prop == cv2.CAP_PROP_FPS and self.interval else 0.0
+
+	def release(self):
+		pass
+
+def parse_source(source):
+	# webcam indexes may come in as strings from the API
+	if isinstance(source, str) and source.strip().isdigit():
+		return int(source)
+	return source
+
+def open_source(source):
+	# open a video file, a network stream (RTSP/HTTP), a webcam index or
+	# a synthetic source
+	source = parse_source(source)
+	if isinstance(source, str) and source.startswith("synthetic"):
+		(size, _, fps) = source.partition(":")[2].partition("@")
+		(width, _, height) = size.partition("x")
+		return SyntheticSource(int(width or 640), int(height or 480), float(fps or 25))
+	return cv2.VideoCapture(source)
+
+def is_file(source):
+	# files end, everything else is reconnected when it stops
+	source = parse_source(source)
+	return isinstance(source, str) and "://" not in source and not source.startswith("synthetic")
+
+def probe(source):
+	# check that a source can be opened
+	cap = open_source(source)
+	try:
+		return cap.isOpened()
+	finally:
+		cap.release()
+
+class Capture:
+
+	"""
+	Reads one source on a background thread into a ring of N slots
+	(one by default) and hands the consumer the most recent frame, with
+	its sequence number and capture time, so a slow pipeline always
+	works on the newest picture instead of a backlog. With a target
+	frame rate every packet is still grabbed, to keep the stream current,
+	but only the frames the pipeline will get are decoded. Network sources
+	and webcams are reopened with an exponential backoff when they fail,
+	files simply end. Counts the frames captured, dropped (overwritten
+	before anyone read them) and processed (handed to the consumer).
+
+	"""
+	def __init__(self, source, slots=1, reconnect=True, minBackoff=0.5,
+		maxBackoff=30.0, realtime=True, targetFps=None):
+		# store the source, the ring size, whether (and how fast) the
+		# source is reopened after it fails, and whether files are read
+		# at their own frame rate rather than as fast as possible
+		self.source = source
+		self.reconnect = reconnect and not is_file(source)
+		self.minBackoff = minBackoff
+		self.maxBackoff = maxBackoff
+		self.realtime = realtime
+
+		# store the rate at which frames are decoded (None decodes every
+		# frame) and when the next one is due
+		self.targetFps = targetFps
+		self.nextDecode = 0.0
+
+		# the ring of the last captured frames, written by the reader
+		# thread under the condition
+		self.slots = [None] * max(1, slots)
+		self.seq = 0
+		self.lastRead = 0
+		self.condition = threading.Condition()
+
+		# set once stop() is called or the source ended for good
+		self.stopped = threading.Event()
+		self.finished = False
+		self.thread = None
+		self.cap = None
+
+		self.stats = {"captured": 0, "dropped": 0, "processed": 0,
+			"reconnects": 0, "failures": 0, "skipped": 0}
+
+	def start(self):
+		# start the reader thread
+		self.thread = threading.Thread(target=self._reader, daemon=True,
+			name="capture-{}".format(self.source))
+		self.thread.start()
+		return self
+
+	def _open(self):
+		# (re)open the source, waiting with an exponential backoff while
+		# it cannot be opened
+		backoff = self.minBackoff
+		while not self.stopped.is_set():
+			cap = open_source(self.source)
+			if cap.isOpened():
+				return cap
+			cap.release()
+			self.stats["failures"] += 1
+			if not self.reconnect:
+				return None
+			self.stopped.wait(backoff)
+			backoff = min(backoff * 2, self.maxBackoff)
+		return None
+
+	def _read(self, cap):
+		# read (and decode) the next frame of the source
+		if not self.targetFps:
+			return cap.read()
+
+		# grab every packet but only decode it if the consumer has taken
+		# the previous frame and the next frame is due, otherwise the
+		# frame is skipped (grabbed but None)
+		if not cap.grab():
+			return (False, None)
+		now = time.time()
+		if self.seq > self.lastRead or now < self.nextDecode:
+			self.stats["skipped"] += 1
+			return (True, None)
+		self.nextDecode = max(self.nextDecode + 1.0 / self.targetFps, now)
+		return cap.retrieve()
+
+	def _reader(self):
+		self.cap = self._open()
+		interval = 0.0
+		if self.cap is not None and self.realtime and is_file(self.source):
+			fps = self.cap.get(cv2.CAP_PROP_FPS)
+			interval = 1.0 / fps if fps > 0 else 0.0
+		backoff = self.minBackoff
+		due = time.time()
+
+		while self.cap is not None and not self.stopped.is_set():
+			(grabbed, image) = self._read(self.cap)
+
+			if not grabbed:
+				# files end here, live sources are reopened
+				self.cap.release()
+				self.stats["failures"] += 1
+				if not self.reconnect:
+					break
+				self.stopped.wait(backoff)
+				backoff = min(backoff * 2, self.maxBackoff)
+				self.stats["reconnects"] += 1
+				self.cap = self._open()
+				continue
+
+			backoff = self.minBackoff
+			if image is not None:
+				self._store(image)
+
+			# read files at their own frame rate so they behave like a
+			# camera
+			if interval > 0:
+				due += interval
+				self.stopped.wait(max(0.0, due - time.time()))
+
+		if self.cap is not None:
+			self.cap.release()
+		with self.condition:
+			self.finished = True
+			self.condition.notify_all()
+
+	def _store(self, image):
+		# write the frame into the next slot of the ring and wake up the
+		# consumer
+		with self.condition:
+			self.seq += 1
+			self.slots[self.seq % len(self.slots)] = CapturedFrame(self.seq, time.time(), image)
+			self.stats["captured"] += 1
+			self.condition.notify_all()
+
+	def read(self, timeout=None, latest=True):
+		# wait for a frame newer than the last one read and return the
+		# newest one (or, with latest=False, the oldest one still in the
+		# ring), None if there is none in time or the source ended
+		with self.condition:
+			if not self.condition.wait_for(lambda: self.seq > self.lastRead
+				or self.finished or self.stopped.is_set(), timeout):
+				return None
+			if self.seq <= self.lastRead:
+				return None
+
+			seq = self.seq if latest else max(self.lastRead + 1, self.seq - len(self.slots) + 1)
+			frame = self.slots[seq % len(self.slots)]
+			self.stats["dropped"] += seq - self.lastRead - 1
+			self.stats["processed"] += 1
+			self.lastRead = seq
+			return frame
+
+	def running(self):
+		# whether frames can still arrive
+		return not (self.finished or self.stopped.is_set())
+
+	def stop(self, timeout=5.0):
+		# stop the reader thread and release the source (a network read
+		# that hangs is left to finish on its own)
+		self.stopped.set()
+		with self.condition:
+			self.condition.notify_all()
+		if self.thread is not None:
+			self.thread.join(timeout)
+
+	def get_stats(self):
+		return dict(self.stats, slots=len(self.slots), seq=self.seq,
+			running=self.running())
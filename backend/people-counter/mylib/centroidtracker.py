@@ -1,17 +1,79 @@
 # import the necessary packages
 from scipy.spatial import distance as dist
-from collections import OrderedDict
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import numpy as np
 
+# the column offsets of the neighbouring grid cells
+GRID_COLUMNS = np.array([-1, 0, 1])
+
+# the largest cost added to a pair to break ties between assignments of
+# the same distance (small next to the distances of integer centroids,
+# large enough to survive the rounding of the assignment solver)
+TIEBREAK = 1e-6
+
+def grid_pairs(a, b, radius):
+	# hash the points of b into square cells the size of the radius, so
+	# every point of b within the radius of a point of a lies in one of
+	# the 3x3 cells around it
+	size = max(float(radius), 1.0)
+	cellA = (a // size).astype("int64")
+	cellB = (b // size).astype("int64")
+	low = np.minimum(cellA.min(axis=0), cellB.min(axis=0)) - 1
+	span = np.maximum(cellA.max(axis=0), cellB.max(axis=0)) - low + 2
+	keyB = (cellB[:, 0] - low[0]) * span[1] + (cellB[:, 1] - low[1])
+	order = np.argsort(keyB, kind="stable")
+	keyB = keyB[order]
+
+	# the three cells of a grid column are consecutive keys, so the
+	# sorted b points of each column of neighbours are one range
+	keyA = (cellA[:, 0] - low[0]) * span[1] + (cellA[:, 1] - low[1])
+	keys = (keyA[:, None] + GRID_COLUMNS[None, :] * span[1]).ravel()
+	lo = np.searchsorted(keyB, keys - 1, side="left")
+	counts = np.searchsorted(keyB, keys + 1, side="right") - lo
+
+	# expand the ranges into candidate (row, column) pairs
+	total = int(counts.sum())
+	rows = np.repeat(np.arange(len(a)).repeat(len(GRID_COLUMNS)), counts)
+	within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+	cols = order[np.repeat(lo, counts) + within]
+
+	# keep the pairs that really are within the radius
+	diff = (a[rows] - b[cols]).astype("float")
+	d = np.sqrt((diff ** 2).sum(axis=1))
+	keep = d <= radius
+	return (rows[keep], cols[keep], d[keep])
+
 class CentroidTracker:
-	def __init__(self, maxDisappeared=50, maxDistance=50):
-		# initialize the next unique object ID along with two ordered
-		# dictionaries used to keep track of mapping a given object
-		# ID to its centroid and number of consecutive frames it has
-		# been marked as "disappeared", respectively
+
+	"""
+	Associates the boxes of every frame with the objects of the previous
+	frames by the distance between their centroids. The objects live in
+	preallocated NumPy arrays (IDs, centroids, boxes and disappeared
+	counters, one slot per object) and are deregistered by moving the
+	last slot into the freed one. Matching is either the original greedy
+	pass or an optimal (Hungarian) assignment, both gated by maxDistance.
+	Above gridThreshold objects only the pairs found through a spatial
+	hash grid are scored instead of the full distance matrix, and the
+	assignment is solved per group of linked pairs, with the same
+	result.
+
+	"""
+	def __init__(self, maxDisappeared=50, maxDistance=50, matching="greedy",
+		capacity=64, gridThreshold=400):
+		# initialize the next unique object ID along with the number of
+		# objects currently tracked
 		self.nextObjectID = 0
-		self.objects = OrderedDict()
-		self.disappeared = OrderedDict()
+		self.count = 0
+
+		# the struct-of-arrays storage of the tracked objects: slot i
+		# holds the ID, centroid, bounding box and number of consecutive
+		# frames object i has been marked as "disappeared"
+		self.ids = np.zeros((capacity,), dtype="int")
+		self.centroids = np.zeros((capacity, 2), dtype="int")
+		self.boxes = np.zeros((capacity, 4), dtype="int")
+		self.missing = np.zeros((capacity,), dtype="int")
 
 		# store the number of maximum consecutive frames a given
 		# object is allowed to be marked as "disappeared" until we
@@ -23,141 +85,249 @@ class CentroidTracker:
 		# distance we'll start to mark the object as "disappeared"
 		self.maxDistance = maxDistance
 
-	def register(self, centroid):
+		# the IDs deregistered by the last update, so the caller can drop
+		# whatever it keeps per object
+		self.deregistered = []
+
+		# store how the centroids are matched, "greedy" or "hungarian",
+		# and the number of objects from which candidate pairs are looked
+		# up in a grid (None to always use the full distance matrix)
+		self.matching = matching
+		self.gridThreshold = gridThreshold
+
+	def _grow(self, needed):
+		# double the capacity of every array until the needed number of
+		# slots fits
+		capacity = len(self.ids)
+		while capacity < needed:
+			capacity *= 2
+		if capacity == len(self.ids):
+			return
+
+		for name in ("ids", "centroids", "boxes", "missing"):
+			old = getattr(self, name)
+			new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:self.count] = old[:self.count]
+			setattr(self, name, new)
+
+	def register(self, centroid, box=None):
 		# when registering an object we use the next available object
-		# ID to store the centroid
-		self.objects[self.nextObjectID] = centroid
-		self.disappeared[self.nextObjectID] = 0
-		self.nextObjectID += 1
+		# ID and the next free slot to store the centroid
+		self._register(np.asarray(centroid, dtype="int").reshape(1, 2),
+			None if box is None else np.asarray(box, dtype="int").reshape(1, 4))
+
+	def _register(self, centroids, boxes=None):
+		# register a batch of new objects in consecutive slots
+		n = len(centroids)
+		self._grow(self.count + n)
+		(start, end) = (self.count, self.count + n)
+		self.ids[start:end] = np.arange(self.nextObjectID, self.nextObjectID + n)
+		self.centroids[start:end] = centroids
+		self.boxes[start:end] = 0 if boxes is None else boxes
+		self.missing[start:end] = 0
+		self.nextObjectID += n
+		self.count = end
 
 	def deregister(self, objectID):
-		# to deregister an object ID we delete the object ID from
-		# both of our respective dictionaries
-		del self.objects[objectID]
-		del self.disappeared[objectID]
+		# to deregister an object ID we free the slot that holds it
+		slots = np.flatnonzero(self.ids[:self.count] == objectID)
+		if len(slots) > 0:
+			self._remove(slots)
+
+	def _remove(self, slots):
+		# free the given slots by moving the last used slot into each of
+		# them, from the highest slot down so every slot moved is alive
+		for slot in np.sort(slots)[::-1]:
+			self.deregistered.append(int(self.ids[slot]))
+			last = self.count - 1
+			if slot != last:
+				self.ids[slot] = self.ids[last]
+				self.centroids[slot] = self.centroids[last]
+				self.boxes[slot] = self.boxes[last]
+				self.missing[slot] = self.missing[last]
+			self.count = last
+
+	def _age(self, slots):
+		# mark the given objects as disappeared for one more frame and
+		# deregister the ones that have been missing for too long
+		self.missing[slots] += 1
+		expired = slots[self.missing[slots] > self.maxDisappeared]
+		if len(expired) > 0:
+			self._remove(expired)
+
+	def _match_greedy(self, D):
+		# in order to perform this matching we must (1) find the
+		# smallest value in each row and then (2) sort the row indexes
+		# based on their minimum values (ties go to the older object)
+		# so that the row with the smallest value is at the *front* of
+		# the index list
+		n = D.shape[0]
+		rows = np.lexsort((self.ids[:n], D.min(axis=1)))
+
+		# next, we perform a similar process on the columns by finding
+		# the smallest value in each row, in that order
+		cols = D.argmin(axis=1)[rows]
+
+		# a pair is used unless its centroids are too far apart or its
+		# column was already taken by an earlier row
+		keep = D[rows, cols] <= self.maxDistance
+		(rows, cols) = (rows[keep], cols[keep])
+		(cols, first) = np.unique(cols, return_index=True)
+		return (rows[first], cols)
+
+	def _match_greedy_pairs(self, rows, cols, d):
+		# the greedy pass over the candidate pairs only: every row that
+		# has a candidate has its minimum among them, the lowest column
+		# winning ties like argmin does, and rows without candidates
+		# would have been dropped by the distance check anyway
+		if len(rows) == 0:
+			return (rows, cols)
+		order = np.lexsort((cols, d, rows))
+		(rows, cols, d) = (rows[order], cols[order], d[order])
+		first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+		(rows, cols, d) = (rows[first], cols[first], d[first])
+
+		# sort the rows by their minimum (ties go to the older object)
+		# and let the first row claim each column
+		order = np.lexsort((self.ids[rows], d))
+		(rows, cols) = (rows[order], cols[order])
+		(cols, first) = np.unique(cols, return_index=True)
+		return (rows[first], cols)
+
+	def _tiebreak(self, slots, cols):
+		# a tiny pseudo-random cost for every (object ID, input centroid)
+		# pair: integer centroids often give several assignments of the
+		# same cost, and this picks the same one however the problem is
+		# split up
+		x = self.ids[slots].astype("uint64") * np.uint64(0x9E3779B97F4A7C15) + \
+			np.asarray(cols).astype("uint64") * np.uint64(0xBF58476D1CE4E5B9)
+		x ^= x >> np.uint64(31)
+		x *= np.uint64(0x94D049BB133111EB)
+		x ^= x >> np.uint64(29)
+		return (x >> np.uint64(11)).astype("float") * (TIEBREAK / 2.0 ** 53)
+
+	def _match_hungarian(self, D, valid=None, tiebroken=False):
+		# solve the assignment over the pairs that are close enough,
+		# every other pair gets a cost no valid assignment would pick
+		# (the distances of the grid path already carry their tie
+		# breaker, the rows and columns of D are not slots there)
+		valid = D <= self.maxDistance if valid is None else valid
+		big = (D.shape[0] + D.shape[1]) * (self.maxDistance + 1.0) + 1.0
+		cost = np.full(D.shape, big)
+		(r, c) = np.nonzero(valid)
+		cost[r, c] = D[r, c] if tiebroken else D[r, c] + self._tiebreak(r, c)
+		(rows, cols) = linear_sum_assignment(cost)
+		keep = valid[rows, cols]
+		return (rows[keep], cols[keep])
+
+	def _match_grid(self, inputCentroids):
+		# score only the pairs of centroids that share a neighbourhood
+		# in the grid
+		n = self.count
+		(rows, cols, d) = grid_pairs(self.centroids[:n], inputCentroids, self.maxDistance)
+		if self.matching != "hungarian":
+			return self._match_greedy_pairs(rows, cols, d)
+
+		# the assignment falls apart into independent problems, one per
+		# group of objects and centroids linked by candidate pairs; a
+		# group of a single pair is matched as is
+		if len(rows) == 0:
+			return (rows, cols)
+		m = len(inputCentroids)
+		graph = coo_matrix((np.ones(len(rows)), (rows, n + cols)), shape=(n + m, n + m))
+		label = connected_components(graph, directed=False)[1][rows]
+		single = np.bincount(label)[label] == 1
+		d = d + self._tiebreak(rows, cols)
+		(matchedRows, matchedCols) = ([rows[single]], [cols[single]])
+
+		# solve every other group on its own small cost matrix
+		rest = np.flatnonzero(~single)
+		rest = rest[np.argsort(label[rest], kind="stable")]
+		bounds = np.flatnonzero(np.r_[True, label[rest][1:] != label[rest][:-1], True])
+		for (start, end) in zip(bounds[:-1], bounds[1:]):
+			pairs = rest[start:end]
+			(groupRows, r) = np.unique(rows[pairs], return_inverse=True)
+			(groupCols, c) = np.unique(cols[pairs], return_inverse=True)
+			D = np.zeros((len(groupRows), len(groupCols)), dtype="float")
+			valid = np.zeros(D.shape, dtype="bool")
+			D[r, c] = d[pairs]
+			valid[r, c] = True
+			(r, c) = self._match_hungarian(D, valid, tiebroken=True)
+			matchedRows.append(groupRows[r])
+			matchedCols.append(groupCols[c])
+
+		return (np.concatenate(matchedRows), np.concatenate(matchedCols))
 
 	def update(self, rects):
+		# forget the IDs deregistered by the previous update
+		self.deregistered = []
+
 		# check to see if the list of input bounding box rectangles
 		# is empty
 		if len(rects) == 0:
-			# loop over any existing tracked objects and mark them
-			# as disappeared
-			for objectID in list(self.disappeared.keys()):
-				self.disappeared[objectID] += 1
-
-				# if we have reached a maximum number of consecutive
-				# frames where a given object has been marked as
-				# missing, deregister it
-				if self.disappeared[objectID] > self.maxDisappeared:
-					self.deregister(objectID)
-
-			# return early as there are no centroids or tracking info
-			# to update
+			# mark every existing tracked object as disappeared and
+			# return early as there are no centroids to update
+			self._age(np.arange(self.count))
 			return self.objects
 
-		# initialize an array of input centroids for the current frame
-		inputCentroids = np.zeros((len(rects), 2), dtype="int")
-
-		# loop over the bounding box rectangles
-		for (i, (startX, startY, endX, endY)) in enumerate(rects):
-			# use the bounding box coordinates to derive the centroid
-			cX = int((startX + endX) / 2.0)
-			cY = int((startY + endY) / 2.0)
-			inputCentroids[i] = (cX, cY)
+		# derive the input centroids of the current frame from the
+		# bounding box rectangles in one go
+		boxes = np.asarray(rects).reshape(-1, 4).astype("int")
+		inputCentroids = ((boxes[:, :2] + boxes[:, 2:]) / 2.0).astype("int")
 
 		# if we are currently not tracking any objects take the input
 		# centroids and register each of them
-		if len(self.objects) == 0:
-			for i in range(0, len(inputCentroids)):
-				self.register(inputCentroids[i])
+		if self.count == 0:
+			self._register(inputCentroids, boxes)
+			return self.objects
 
-		# otherwise, are are currently tracking objects so we need to
-		# try to match the input centroids to existing object
-		# centroids
+		# compute the distance between each pair of object centroids
+		# and input centroids, respectively, and match them (in crowds
+		# only the nearby pairs are scored)
+		n = self.count
+		if self.gridThreshold is not None and n >= self.gridThreshold:
+			(rows, cols) = self._match_grid(inputCentroids)
 		else:
-			# grab the set of object IDs and corresponding centroids
-			objectIDs = list(self.objects.keys())
-			objectCentroids = list(self.objects.values())
-
-			# compute the distance between each pair of object
-			# centroids and input centroids, respectively -- our
-			# goal will be to match an input centroid to an existing
-			# object centroid
-			D = dist.cdist(np.array(objectCentroids), inputCentroids)
-
-			# in order to perform this matching we must (1) find the
-			# smallest value in each row and then (2) sort the row
-			# indexes based on their minimum values so that the row
-			# with the smallest value as at the *front* of the index
-			# list
-			rows = D.min(axis=1).argsort()
-
-			# next, we perform a similar process on the columns by
-			# finding the smallest value in each column and then
-			# sorting using the previously computed row index list
-			cols = D.argmin(axis=1)[rows]
-
-			# in order to determine if we need to update, register,
-			# or deregister an object we need to keep track of which
-			# of the rows and column indexes we have already examined
-			usedRows = set()
-			usedCols = set()
-
-			# loop over the combination of the (row, column) index
-			# tuples
-			for (row, col) in zip(rows, cols):
-				# if we have already examined either the row or
-				# column value before, ignore it
-				if row in usedRows or col in usedCols:
-					continue
-
-				# if the distance between centroids is greater than
-				# the maximum distance, do not associate the two
-				# centroids to the same object
-				if D[row, col] > self.maxDistance:
-					continue
-
-				# otherwise, grab the object ID for the current row,
-				# set its new centroid, and reset the disappeared
-				# counter
-				objectID = objectIDs[row]
-				self.objects[objectID] = inputCentroids[col]
-				self.disappeared[objectID] = 0
-
-				# indicate that we have examined each of the row and
-				# column indexes, respectively
-				usedRows.add(row)
-				usedCols.add(col)
-
-			# compute both the row and column index we have NOT yet
-			# examined
-			unusedRows = set(range(0, D.shape[0])).difference(usedRows)
-			unusedCols = set(range(0, D.shape[1])).difference(usedCols)
-
-			# in the event that the number of object centroids is
-			# equal or greater than the number of input centroids
-			# we need to check and see if some of these objects have
-			# potentially disappeared
-			if D.shape[0] >= D.shape[1]:
-				# loop over the unused row indexes
-				for row in unusedRows:
-					# grab the object ID for the corresponding row
-					# index and increment the disappeared counter
-					objectID = objectIDs[row]
-					self.disappeared[objectID] += 1
-
-					# check to see if the number of consecutive
-					# frames the object has been marked "disappeared"
-					# for warrants deregistering the object
-					if self.disappeared[objectID] > self.maxDisappeared:
-						self.deregister(objectID)
-
-			# otherwise, if the number of input centroids is greater
-			# than the number of existing object centroids we need to
-			# register each new input centroid as a trackable object
+			D = dist.cdist(self.centroids[:n], inputCentroids)
+			if self.matching == "hungarian":
+				(rows, cols) = self._match_hungarian(D)
 			else:
-				for col in unusedCols:
-					self.register(inputCentroids[col])
+				(rows, cols) = self._match_greedy(D)
+
+		# set the new centroids of the matched objects and reset their
+		# disappeared counters
+		self.centroids[rows] = inputCentroids[cols]
+		self.boxes[rows] = boxes[cols]
+		self.missing[rows] = 0
+
+		# the unmatched objects have potentially disappeared, and every
+		# unmatched input centroid is a new trackable object
+		unusedRows = np.ones(n, dtype="bool")
+		unusedRows[rows] = False
+		unusedCols = np.ones(len(inputCentroids), dtype="bool")
+		unusedCols[cols] = False
+
+		self._age(np.flatnonzero(unusedRows))
+		if unusedCols.any():
+			self._register(inputCentroids[unusedCols], boxes[unusedCols])
 
 		# return the set of trackable objects
-		return self.objects
\ No newline at end of file
+		return self.objects
+
+	def tracks(self):
+		# the IDs and centroids of the tracked objects as arrays, in
+		# registration order
+		n = self.count
+		order = np.argsort(self.ids[:n], kind="stable")
+		return (self.ids[order], self.centroids[order])
+
+	@property
+	def objects(self):
+		# the mapping of object ID to centroid, in registration order
+		(ids, centroids) = self.tracks()
+		return dict(zip(ids.tolist(), centroids))
+
+	@property
+	def disappeared(self):
+		n = self.count
+		return dict(zip(self.ids[:n].tolist(), self.missing[:n].tolist()))
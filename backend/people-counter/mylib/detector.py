@@ -0,0 +1,343 @@
+# import the necessary packages
+from collections import deque
+import threading, queue, time, os
+import numpy as np
+import cv2
+
+# the OpenCV DNN backend/target combinations a network can run on,
+# keyed by the name used on the command line and over the API
+BACKENDS = {
+	"opencv-cpu": ("DNN_BACKEND_OPENCV", "DNN_TARGET_CPU"),
+	"opencv-opencl": ("DNN_BACKEND_OPENCV", "DNN_TARGET_OPENCL"),
+	"opencv-opencl-fp16": ("DNN_BACKEND_OPENCV", "DNN_TARGET_OPENCL_FP16"),
+	"openvino-cpu": ("DNN_BACKEND_INFERENCE_ENGINE", "DNN_TARGET_CPU"),
+	"cuda": ("DNN_BACKEND_CUDA", "DNN_TARGET_CUDA"),
+	"cuda-fp16": ("DNN_BACKEND_CUDA", "DNN_TARGET_CUDA_FP16"),
+}
+
+def load_net(model, prototxt=None, backend="opencv-cpu"):
+	# load an ONNX model or a Caffe model (with its 'deploy' prototxt)
+	# from disk and set its preferable backend and target
+	if os.path.splitext(model)[1].lower() == ".onnx":
+		net = cv2.dnn.readNetFromONNX(model)
+	else:
+		net = cv2.dnn.readNetFromCaffe(prototxt, model)
+
+	(backendID, targetID) = BACKENDS[backend]
+	net.setPreferableBackend(getattr(cv2.dnn, backendID))
+	net.setPreferableTarget(getattr(cv2.dnn, targetID))
+	return net
+
+def available_backends():
+	# only keep the combinations this OpenCV build actually supports,
+	# since an unsupported one silently falls back to the CPU
+	names = []
+	for (name, (backendID, targetID)) in BACKENDS.items():
+		if not hasattr(cv2.dnn, backendID) or not hasattr(cv2.dnn, targetID):
+			continue
+		backend = getattr(cv2.dnn, backendID)
+		target = getattr(cv2.dnn, targetID)
+		try:
+			targets = cv2.dnn.getAvailableTargets(backend)
+		except cv2.error:
+			continue
+		if target in targets:
+			names.append(name)
+	return names
+
+def load_sample(path="example.png", width=500):
+	# read the sample frame used to benchmark the backends and resize
+	# it like the pipelines do, or fall back to random noise
+	frame = cv2.imread(path) if os.path.exists(path) else None
+	if frame is None:
+		frame = np.random.randint(0, 256, (375, width, 3), dtype="uint8")
+	(h, w) = frame.shape[:2]
+	return cv2.resize(frame, (width, int(h * width / float(w))), interpolation=cv2.INTER_AREA)
+
+def benchmark_backends(model, prototxt, sample, backends=None, runs=10,
+	scale=0.007843, mean=127.5):
+	# time a forward pass of the sample frame on every backend and
+	# return the results sorted from fastest to slowest, skipping the
+	# backends that fail to load or run
+	(H, W) = sample.shape[:2]
+	blob = cv2.dnn.blobFromImage(sample, scale, (W, H), mean)
+	results = []
+
+	for name in backends or available_backends():
+		try:
+			net = load_net(model, prototxt, name)
+
+			# the first pass includes the backend initialization, so it
+			# is only used to warm the network up
+			net.setInput(blob)
+			net.forward()
+
+			times = []
+			for i in range(runs):
+				start = time.time()
+				net.setInput(blob)
+				net.forward()
+				times.append((time.time() - start) * 1000.0)
+		except cv2.error:
+			continue
+
+		results.append({"backend": name, "latency_ms": round(float(np.median(times)), 2)})
+
+	return sorted(results, key=lambda r: r["latency_ms"])
+
+def select_backend(model, prototxt, backend="auto", sample="example.png",
+	scale=0.007843, mean=127.5):
+	# return the requested backend as is, or benchmark the available
+	# ones on the sample frame and return the fastest, along with the
+	# benchmark results
+	if backend != "auto":
+		return (backend, [])
+
+	results = benchmark_backends(model, prototxt, load_sample(sample),
+		scale=scale, mean=mean)
+	return (results[0]["backend"] if results else "opencv-cpu", results)
+
+class DetectionRequest:
+	def __init__(self, cameraID, frames):
+		# store the camera the frames came from along with the frames
+		# themselves (all of the same size), then initialize the event
+		# the camera thread waits on until the detector service has
+		# filled in the result
+		self.cameraID = cameraID
+		self.frames = frames
+		self.submitted = time.time()
+		self.done = threading.Event()
+		self.detections = None
+		self.error = None
+
+class DetectorService:
+
+	"""
+	A single MobileNet SSD network shared by every camera pipeline on
+	the host. Camera threads submit frames through a queue and block
+	until the service thread hands back their detections. With a
+	batch size above one, frames of the same size from several cameras
+	are collected for up to maxWait milliseconds and passed through
+	the network in a single forward pass. With the "auto" backend, the
+	available OpenCV backends are benchmarked on a sample frame at
+	startup and the fastest one is used.
+
+	"""
+	def __init__(self, prototxt, model, scale=0.007843, mean=127.5,
+		batchSize=1, maxWait=10.0, backend="auto", sample="example.png"):
+		# store the model paths along with the blob parameters used
+		# to prepare every frame for the network
+		self.prototxt = prototxt
+		self.model = model
+		self.scale = scale
+		self.mean = mean
+
+		# store the requested backend (or "auto") and the sample frame
+		# used to benchmark the backends
+		self.backend = backend
+		self.sample = sample
+		self.benchmark = []
+
+		# store the maximum number of frames per forward pass and the
+		# maximum time (in milliseconds) the first frame of a batch
+		# may wait for others to join it
+		self.batchSize = max(1, batchSize)
+		self.maxWait = maxWait
+
+		# frames that could not join the current batch (because their
+		# size differs) are held here and served first next time
+		self.deferred = deque()
+
+		# the network is loaded once, on the service thread, so that
+		# all cameras share one warm copy of the model
+		self.net = None
+		self.requests = queue.Queue()
+		self.stopped = threading.Event()
+		self.thread = None
+
+		# per-camera bookkeeping of how many detections were served
+		# and how long their frames waited in the queue, along with
+		# the totals across all forward passes
+		self.lock = threading.Lock()
+		self.stats = {}
+		self.batches = 0
+		self.batchedFrames = 0
+
+	def start(self):
+		# pick the fastest backend if none was requested, then load
+		# the serialized model from disk and start the thread that
+		# drains the request queue
+		(self.backend, self.benchmark) = select_backend(self.model,
+			self.prototxt, self.backend, self.sample, self.scale, self.mean)
+
+		self.net = load_net(self.model, self.prototxt, self.backend)
+		self.thread = threading.Thread(target=self._serve, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		# signal the service thread to exit and fail any request that
+		# is still waiting so no camera thread blocks forever
+		self.stopped.set()
+		self.requests.put(None)
+		if self.thread is not None:
+			self.thread.join()
+
+		while True:
+			request = self._next(timeout=0)
+			if request is None and self.requests.empty():
+				break
+			if request is not None:
+				request.error = RuntimeError("detector service stopped")
+				request.done.set()
+
+	def detect(self, cameraID, frame, timeout=None):
+		# queue the frame for the shared network and wait for the
+		# service thread to return this camera's detections
+		return self.detect_many(cameraID, [frame], timeout)[0]
+
+	def detect_many(self, cameraID, frames, timeout=None):
+		# queue several frames of the same size (e.g. the tiles of one
+		# camera frame) that are always passed through the network in
+		# the same forward pass, and return one result per frame
+		if self.stopped.is_set():
+			raise RuntimeError("detector service stopped")
+
+		request = DetectionRequest(cameraID, frames)
+		self.requests.put(request)
+
+		if not request.done.wait(timeout):
+			raise TimeoutError("detection for camera {} timed out".format(cameraID))
+		if request.error is not None:
+			raise request.error
+
+		return request.detections
+
+	def release(self, cameraID):
+		# drop the bookkeeping of a camera that has been removed
+		with self.lock:
+			self.stats.pop(cameraID, None)
+
+	def get_stats(self):
+		with self.lock:
+			return {cameraID: dict(s) for (cameraID, s) in self.stats.items()}
+
+	def get_backend(self):
+		# the chosen backend along with its measured latency and the
+		# latency of every other backend benchmarked at startup
+		latency = None
+		for r in self.benchmark:
+			if r["backend"] == self.backend:
+				latency = r["latency_ms"]
+		return {"backend": self.backend, "latency_ms": latency, "benchmark": self.benchmark}
+
+	def get_batch_stats(self):
+		with self.lock:
+			meanBatch = self.batchedFrames / self.batches if self.batches else 0.0
+			return {
+				"batch_size": self.batchSize,
+				"max_wait_ms": self.maxWait,
+				"batches": self.batches,
+				"mean_batch": round(meanBatch, 2),
+			}
+
+	def _serve(self):
+		while not self.stopped.is_set():
+			batch = self._collect()
+			if not batch:
+				continue
+
+			dispatched = time.time()
+			try:
+				results = self._forward([f for r in batch for f in r.frames])
+			except Exception as e:
+				results = None
+				for request in batch:
+					request.error = e
+
+			# hand every request back the slice of results that belongs
+			# to its frames
+			self._record(batch, dispatched)
+			start = 0
+			for request in batch:
+				if results is not None:
+					request.detections = results[start:start + len(request.frames)]
+				start += len(request.frames)
+				request.done.set()
+
+	def _next(self, timeout=None):
+		# serve frames deferred from a previous batch before reading
+		# new ones from the queue
+		if self.deferred:
+			return self.deferred.popleft()
+		try:
+			return self.requests.get(timeout=timeout)
+		except queue.Empty:
+			return None
+
+	def _collect(self):
+		# block until the first frame of the batch arrives
+		first = self._next()
+		if first is None:
+			return []
+
+		batch = [first]
+		size = len(first.frames)
+		shape = first.frames[0].shape
+		deadline = first.submitted + self.maxWait / 1000.0
+		skipped = []
+
+		# keep adding frames of the same size until the batch is full
+		# or the first frame has waited long enough
+		while size < self.batchSize:
+			remaining = deadline - time.time()
+			if remaining <= 0 and not self.deferred and self.requests.empty():
+				break
+
+			request = self._next(timeout=max(remaining, 0))
+			if request is None:
+				if self.stopped.is_set() or remaining <= 0:
+					break
+				continue
+
+			if request.frames[0].shape == shape and size + len(request.frames) <= self.batchSize:
+				batch.append(request)
+				size += len(request.frames)
+			else:
+				skipped.append(request)
+
+		self.deferred.extend(skipped)
+		return batch
+
+	def _forward(self, frames):
+		# convert the frames to a single blob at their own resolution
+		# and pass the blob through the network
+		(H, W) = frames[0].shape[:2]
+		blob = cv2.dnn.blobFromImages(frames, self.scale, (W, H), self.mean)
+		self.net.setInput(blob)
+		detections = self.net.forward()
+
+		# the first column of every SSD detection is the index of the
+		# image it belongs to, so slice the output back per frame while
+		# keeping the (1, 1, N, 7) shape of a single-image forward pass
+		if len(frames) == 1:
+			return [detections]
+		imageIDs = detections[0, 0, :, 0].astype("int")
+		return [detections[:, :, imageIDs == i, :] for i in range(len(frames))]
+
+	def _record(self, batch, dispatched):
+		with self.lock:
+			self.batches += 1
+			self.batchedFrames += sum(len(r.frames) for r in batch)
+
+			for request in batch:
+				# track the queueing latency of every frame as both the
+				# latest value and a running average
+				latency = (dispatched - request.submitted) * 1000.0
+				s = self.stats.setdefault(request.cameraID,
+					{"detections": 0, "queue_ms": 0.0, "mean_queue_ms": 0.0})
+				s["detections"] += len(request.frames)
+				s["queue_ms"] = round(latency, 2)
+				s["requests"] = s.get("requests", 0) + 1
+				s["mean_queue_ms"] = round(s["mean_queue_ms"]
+					+ (latency - s["mean_queue_ms"]) / s["requests"], 2)
@@ -0,0 +1,67 @@
+# import the necessary packages
+from collections import deque
+import threading
+import time
+
+class FeedMeter:
+
+	"""
+	Keeps track of the video feed viewers and of the format each of them
+	asked for ("base64" JSON frames or "binary" attachments), and measures
+	for every format the bytes sent per second and the server CPU time
+	spent per viewer, over a sliding window, so both formats can be
+	compared on the same server.
+
+	"""
+	FORMATS = ("base64", "binary")
+
+	def __init__(self, window=10.0):
+		# store the length of the window (in seconds) and the viewers,
+		# along with the frames sent in the window for every format
+		self.window = window
+		self.viewers = {}
+		self.sent = {fmt: deque() for fmt in self.FORMATS}
+		self.totals = {fmt: {"frames": 0, "bytes": 0} for fmt in self.FORMATS}
+		self.lock = threading.Lock()
+
+	def join(self, sid, fmt):
+		# a viewer connected or switched format
+		with self.lock:
+			self.viewers[sid] = fmt
+
+	def leave(self, sid):
+		with self.lock:
+			self.viewers.pop(sid, None)
+
+	def count(self, fmt):
+		# the number of viewers of a format
+		with self.lock:
+			return sum(1 for f in self.viewers.values() if f == fmt)
+
+	def record(self, fmt, size, viewers, cpu):
+		# a frame of the given size (in bytes) was sent to the given
+		# number of viewers, which took the given CPU time (in seconds)
+		now = time.time()
+		with self.lock:
+			sent = self.sent[fmt]
+			sent.append((now, size * viewers, cpu, viewers))
+			while sent and sent[0][0] < now - self.window:
+				sent.popleft()
+			self.totals[fmt]["frames"] += 1
+			self.totals[fmt]["bytes"] += size * viewers
+
+	def get_stats(self):
+		now = time.time()
+		with self.lock:
+			stats = {}
+			for fmt in self.FORMATS:
+				sent = [s for s in self.sent[fmt] if s[0] >= now - self.window]
+				sentBytes = sum(s[1] for s in sent)
+				cpu = sum(s[2] for s in sent)
+				deliveries = sum(s[3] for s in sent)
+				stats[fmt] = dict(self.totals[fmt],
+					viewers=sum(1 for f in self.viewers.values() if f == fmt),
+					bytes_per_s=round(sentBytes / self.window, 1),
+					cpu_ms_per_s=round(cpu * 1000.0 / self.window, 2),
+					cpu_ms_per_viewer_frame=round(cpu * 1000.0 / deliveries, 3) if deliveries else None)
+			return stats
@@ -0,0 +1,131 @@
+# import the necessary packages
+import numpy as np
+import cv2
+
+class FlowCounter:
+
+	"""
+	Estimates how many people cross the counting lines of a camera from
+	the dense optical flow in a narrow band around them, for crowds too
+	large to detect and track person by person. The flow across the
+	lines (along the same normals the line counter uses) gives the area
+	that went in and out every frame, and the area of one person is
+	calibrated against the line counter while the crowd is still small
+	enough to track. The counter also decides when to switch between
+	tracking and flow counting, with hysteresis on the number of people
+	the detector sees.
+
+	"""
+	def __init__(self, polylines, W, H, band=10, scale=0.5, minFlow=0.3,
+		enterAt=40, leaveAt=25, areaPerPerson=None, minPeople=10, alpha=0.2):
+		# store the scale of the flow image, the flow (in flow image
+		# pixels per frame) below which a pixel counts as still, the
+		# number of people from which the crowd mode is entered and left,
+		# and the calibration settings: the number of counted people per
+		# calibration step and the weight of every new step
+		self.scale = scale
+		self.minFlow = minFlow
+		self.enterAt = enterAt
+		self.leaveAt = leaveAt
+		self.minPeople = minPeople
+		self.alpha = alpha
+
+		# rasterize a band of the given half width (in processing pixels)
+		# around every segment, labelled by segment, and keep the unit
+		# normal of every segment
+		(w, h) = (int(W * scale), int(H * scale))
+		self.labels = np.zeros((h, w), dtype="uint16")
+		normals = [(0.0, 0.0)]
+		for points in polylines:
+			points = np.asarray(points, dtype="float") * scale
+			for (a, b) in zip(points[:-1], points[1:]):
+				d = b - a
+				normals.append(np.array([-d[1], d[0]]) / max(np.hypot(d[0], d[1]), 1e-6))
+				cv2.line(self.labels, tuple(int(v) for v in a.round()),
+					tuple(int(v) for v in b.round()), len(normals) - 1,
+					max(1, int(2 * band * scale)))
+		self.normals = np.asarray(normals, dtype="float32")
+		self.thickness = max(1.0, 2 * band * scale)
+
+		# only the bounding box of the band goes through the flow
+		(ys, xs) = np.nonzero(self.labels)
+		if len(xs) == 0:
+			(ys, xs) = (np.array([0, h - 1]), np.array([0, w - 1]))
+		self.box = (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+		(x0, y0, x1, y1) = self.box
+		self.band = self.labels[y0:y1, x0:x1]
+		self.nx = self.normals[self.band, 0]
+		self.ny = self.normals[self.band, 1]
+
+		# the previous band image, the current mode, the area of one
+		# person (in flow image pixels) and the running totals
+		self.prev = None
+		self.crowd = False
+		self.areaPerPerson = areaPerPerson or 30.0 * 80.0 * scale * scale
+		self.calibration = [0.0, 0]
+		self.entered = 0.0
+		self.exited = 0.0
+		self.stats = {"switches": 0, "flow_frames": 0, "calibrations": 0}
+
+	def observe(self, people):
+		# switch to the crowd mode once the detector sees enterAt people
+		# and back once it sees no more than leaveAt
+		crowd = people >= self.enterAt if not self.crowd else people > self.leaveAt
+		if crowd != self.crowd:
+			self.crowd = crowd
+			self.stats["switches"] += 1
+		return crowd
+
+	def measure(self, frame):
+		# compute the flow of the band between the previous and this
+		# frame and return the area that went in and out across the lines
+		(x0, y0, x1, y1) = self.box
+		small = cv2.resize(frame, (self.labels.shape[1], self.labels.shape[0]),
+			interpolation=cv2.INTER_AREA)
+		gray = cv2.cvtColor(small[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+		(prev, self.prev) = (self.prev, gray)
+		if prev is None:
+			return (0.0, 0.0)
+
+		flow = cv2.calcOpticalFlowFarneback(prev, gray, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+		self.stats["flow_frames"] += 1
+
+		# project the flow on the normal of the segment every band pixel
+		# belongs to; the area crossing per frame is the flux through the
+		# band divided by its thickness
+		flux = flow[..., 0] * self.nx + flow[..., 1] * self.ny
+		flux[np.abs(flux) < self.minFlow] = 0
+		inArea = float(flux[flux > 0].sum()) / self.thickness
+		outArea = float(-flux[flux < 0].sum()) / self.thickness
+		return (inArea, outArea)
+
+	def skip(self):
+		# a frame without a measurement breaks the flow
+		self.prev = None
+
+	def add(self, inArea, outArea):
+		# count the people in a measured crowd frame
+		self.entered += inArea / self.areaPerPerson
+		self.exited += outArea / self.areaPerPerson
+
+	def calibrate(self, inArea, outArea, entered, exited):
+		# accumulate the flow area along with the people the line counter
+		# counted, and update the area of one person once enough people
+		# were counted
+		self.calibration[0] += inArea + outArea
+		self.calibration[1] += entered + exited
+		(area, people) = self.calibration
+		if people < self.minPeople:
+			return
+
+		if area > 0:
+			self.areaPerPerson += self.alpha * (area / people - self.areaPerPerson)
+			self.stats["calibrations"] += 1
+		self.calibration = [0.0, 0]
+
+	def totals(self):
+		return (int(self.entered), int(self.exited))
+
+	def get_stats(self):
+		return dict(self.stats, crowd=self.crowd, entered=round(self.entered, 1),
+			exited=round(self.exited, 1), area_per_person=round(self.areaPerPerson, 1))
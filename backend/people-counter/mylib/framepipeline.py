@@ -0,0 +1,130 @@
+# import the necessary packages
+import time
+import numpy as np
+import cv2
+
+class FramePipeline:
+
+	"""
+	Produces, for one camera, only the images the pipeline stages ask
+	for: the processing frame used for counting and drawing, the
+	detector input, the (optionally smaller and grayscale) tracker
+	image and the display image. Every stage writes into a buffer that
+	is allocated once and reused for the following frames.
+
+	"""
+	def __init__(self, width=500, detectorWidth=None, trackerScale=1.0,
+		trackerGray=False, displayWidth=None):
+		# store the width of the processing frame (all box coordinates
+		# live in this frame), the width of the detector input, the
+		# scale and color mode of the tracker image and the width of
+		# the image sent to viewers
+		self.width = width
+		self.detectorWidth = detectorWidth
+		self.trackerScale = trackerScale
+		self.trackerGray = trackerGray
+		self.displayWidth = displayWidth
+
+		# the reusable output buffers of every stage
+		self.buffers = {}
+
+		# the tracker image is only converted on the frames that need it
+		self.frame = None
+		self.trackerReady = False
+
+		# per-stage number of calls, buffer allocations and total time
+		self.stats = {}
+
+	def _buffer(self, stage, shape):
+		# return the buffer of the stage, allocating a new one only if
+		# the frame size changed
+		buf = self.buffers.get(stage)
+		if buf is None or buf.shape != shape:
+			buf = np.empty(shape, dtype="uint8")
+			self.buffers[stage] = buf
+			self._counters(stage)["allocations"] += 1
+		return buf
+
+	def _counters(self, stage):
+		return self.stats.setdefault(stage, {"calls": 0, "allocations": 0, "ms": 0.0})
+
+	def _start(self, stage):
+		self._counters(stage)["calls"] += 1
+		return time.time()
+
+	def _stop(self, stage, start):
+		self.stats[stage]["ms"] += (time.time() - start) * 1000.0
+
+	def process(self, raw):
+		# resize the captured frame to the processing width, keeping
+		# the aspect ratio, into the reused processing buffer
+		start = self._start("resize")
+		(h, w) = raw.shape[:2]
+		height = int(h * self.width / float(w))
+		frame = self._buffer("resize", (height, self.width, 3))
+		cv2.resize(raw, (self.width, height), dst=frame, interpolation=cv2.INTER_AREA)
+		self._stop("resize", start)
+
+		# a new frame invalidates the tracker image of the previous one
+		self.frame = frame
+		self.trackerReady = False
+		return frame
+
+	def detector_image(self, image):
+		# the detector input is the given image (the processing frame
+		# or a crop of it) unless a smaller detector width was asked for
+		if self.detectorWidth is None or image.shape[1] <= self.detectorWidth:
+			return image
+
+		start = self._start("detector")
+		(h, w) = image.shape[:2]
+		height = max(1, int(h * self.detectorWidth / float(w)))
+		out = self._buffer("detector", (height, self.detectorWidth, 3))
+		cv2.resize(image, (self.detectorWidth, height), dst=out, interpolation=cv2.INTER_AREA)
+		self._stop("detector", start)
+		return out
+
+	def tracker_image(self):
+		# convert the processing frame for dlib the first time a stage
+		# asks for it during this frame, and reuse it afterwards
+		if self.trackerReady:
+			return self.buffers["tracker"]
+
+		start = self._start("tracker")
+		src = self.frame
+		if self.trackerScale != 1.0:
+			(h, w) = src.shape[:2]
+			size = (int(w * self.trackerScale), int(h * self.trackerScale))
+			src = self._buffer("tracker_resize", (size[1], size[0], 3))
+			cv2.resize(self.frame, size, dst=src, interpolation=cv2.INTER_AREA)
+
+		(h, w) = src.shape[:2]
+		if self.trackerGray:
+			out = self._buffer("tracker", (h, w))
+			cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=out)
+		else:
+			out = self._buffer("tracker", (h, w, 3))
+			cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=out)
+		self._stop("tracker", start)
+
+		self.trackerReady = True
+		return out
+
+	def display_image(self, frame):
+		# scale the annotated frame to the display width if it differs
+		# from the processing width
+		if self.displayWidth is None or self.displayWidth == frame.shape[1]:
+			return frame
+
+		start = self._start("display")
+		(h, w) = frame.shape[:2]
+		height = int(h * self.displayWidth / float(w))
+		out = self._buffer("display", (height, self.displayWidth, 3))
+		cv2.resize(frame, (self.displayWidth, height), dst=out, interpolation=cv2.INTER_AREA)
+		self._stop("display", start)
+		return out
+
+	def get_stats(self):
+		return {stage: {"calls": s["calls"], "allocations": s["allocations"],
+			"mean_ms": round(s["ms"] / s["calls"], 3) if s["calls"] else 0.0}
+			for (stage, s) in self.stats.items()}
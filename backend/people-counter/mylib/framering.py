@@ -0,0 +1,76 @@
+# import the necessary packages
+from multiprocessing import shared_memory
+import time
+import numpy as np
+
+class SharedFrameRing:
+
+	"""
+	A ring of fixed-size frames in shared memory, written by one process
+	and read by another without pickling or copying the frames through a
+	pipe. Every slot has a header with the sequence number and capture
+	time of its frame; the writer clears the sequence number while it
+	writes the slot, so a reader that raced it sees a mismatch and
+	drops the frame instead of returning a torn one.
+
+	"""
+	HEADER = np.dtype([("seq", "i8"), ("timestamp", "f8")])
+
+	def __init__(self, shape, slots=4, name=None, create=True):
+		# store the frame shape and the number of slots, then create
+		# (writer) or attach to (reader) the shared memory block
+		self.shape = tuple(shape)
+		self.slots = slots
+		frameBytes = int(np.prod(self.shape))
+		size = self.HEADER.itemsize * slots + frameBytes * slots
+		self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+		# only the writer unlinks the block (the writer is a process
+		# spawned by the reader, so both share one resource tracker and
+		# the block is tracked once)
+		self.owner = create
+
+		# map the headers and the frames onto the block
+		self.headers = np.ndarray((slots,), dtype=self.HEADER, buffer=self.shm.buf)
+		self.frames = np.ndarray((slots,) + self.shape, dtype="uint8",
+			buffer=self.shm.buf, offset=self.HEADER.itemsize * slots)
+		if create:
+			self.headers["seq"] = 0
+		self.seq = 0
+
+	@property
+	def name(self):
+		return self.shm.name
+
+	def write(self, image, timestamp=None):
+		# write the frame into the next slot and return its sequence
+		# number
+		self.seq += 1
+		slot = self.seq % self.slots
+		self.headers["seq"][slot] = 0
+		self.frames[slot] = image
+		self.headers["timestamp"][slot] = time.time() if timestamp is None else timestamp
+		self.headers["seq"][slot] = self.seq
+		return self.seq
+
+	def read(self, seq):
+		# copy the frame with the given sequence number out of the ring,
+		# None if it was overwritten in the meantime
+		slot = seq % self.slots
+		if self.headers["seq"][slot] != seq:
+			return None
+		image = self.frames[slot].copy()
+		timestamp = float(self.headers["timestamp"][slot])
+		if self.headers["seq"][slot] != seq:
+			return None
+		return (image, timestamp)
+
+	def close(self, unlink=False):
+		# drop the mappings, and the block itself if we created it or the
+		# reader is told to because the writer died without removing it
+		del self.headers, self.frames
+		self.shm.close()
+		if self.owner or unlink:
+			try:
+				self.shm.unlink()
+			except FileNotFoundError:
+				pass
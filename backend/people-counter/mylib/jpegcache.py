@@ -0,0 +1,140 @@
+# import the necessary packages
+import threading
+import time
+import cv2
+
+class JpegSlot:
+
+	"""
+	The latest frame of one camera along with a version number that goes
+	up with every new frame. The frame is JPEG-encoded at most once, the
+	first time anybody asks for it, and the same bytes are then shared by
+	every viewer; viewers block on the condition until a newer version
+	than the one they sent last arrives.
+
+	"""
+	def __init__(self, quality=80):
+		# store the JPEG quality and a tag that tells this slot apart from
+		# an earlier one of the same camera (the version starts over)
+		self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+		self.epoch = "{:x}".format(int(time.time() * 1000))
+
+		# the latest frame, its version, capture time and (once encoded)
+		# its JPEG bytes
+		self.condition = threading.Condition()
+		self.image = None
+		self.version = 0
+		self.timestamp = 0.0
+		self.data = None
+		self.closed = False
+		self.stats = {"published": 0, "encoded": 0, "served": 0}
+
+	def publish(self, image, timestamp=None, encode=False):
+		# the producer hands over its frame without a copy, so it must not
+		# draw on it any more, unless the frame is encoded right away
+		# (for producers that reuse their frame buffers)
+		with self.condition:
+			self.image = image
+			self.data = None
+			self.version += 1
+			self.timestamp = time.time() if timestamp is None else timestamp
+			self.stats["published"] += 1
+			if encode:
+				self._encode()
+				self.image = None
+			self.condition.notify_all()
+		return self.version
+
+	def _encode(self):
+		# encode the current frame unless that was already done (called
+		# with the condition held)
+		if self.data is None and self.image is not None:
+			(flag, encoded) = cv2.imencode(".jpg", self.image, self.params)
+			if flag:
+				self.data = encoded.tobytes()
+				self.stats["encoded"] += 1
+		return self.data
+
+	def get(self):
+		# the version, capture time and JPEG of the current frame (None
+		# before the first frame)
+		with self.condition:
+			data = self._encode()
+			if data is None:
+				return None
+			self.stats["served"] += 1
+			return (self.version, self.timestamp, data)
+
+	def wait(self, version, timeout=None):
+		# wait for a frame newer than the given version and return it as
+		# get() does, None on a timeout or once the slot is closed
+		with self.condition:
+			if not self.condition.wait_for(lambda: self.version > version or self.closed, timeout):
+				return None
+			if self.closed:
+				return None
+			data = self._encode()
+			if data is None:
+				return None
+			self.stats["served"] += 1
+			return (self.version, self.timestamp, data)
+
+	def etag(self, version):
+		return '"{}-{}"'.format(self.epoch, version)
+
+	def close(self):
+		# wake every viewer up so their streams end
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+	def get_stats(self):
+		with self.condition:
+			return dict(self.stats, version=self.version)
+
+class JpegCache:
+
+	"""
+	One JpegSlot per camera, created when the camera publishes its first
+	frame or a viewer asks for it, whichever comes first.
+
+	"""
+	def __init__(self, quality=80):
+		self.quality = quality
+		self.slots = {}
+		self.lock = threading.Lock()
+
+	def slot(self, cameraID):
+		with self.lock:
+			if cameraID not in self.slots:
+				self.slots[cameraID] = JpegSlot(self.quality)
+			return self.slots[cameraID]
+
+	def publish(self, cameraID, image, timestamp=None, encode=False):
+		return self.slot(cameraID).publish(image, timestamp, encode)
+
+	def get(self, cameraID):
+		return self.slot(cameraID).get()
+
+	def stream(self, cameraID, stop=None, timeout=1.0):
+		# generate the multipart MJPEG stream of a camera, one part per
+		# new frame, until the slot is closed or the stop event is set
+		slot = self.slot(cameraID)
+		version = 0
+		while not slot.closed and not (stop is not None and stop.is_set()):
+			frame = slot.wait(version, timeout)
+			if frame is None:
+				continue
+			(version, _, data) = frame
+			yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+
+	def remove(self, cameraID):
+		with self.lock:
+			slot = self.slots.pop(cameraID, None)
+		if slot is not None:
+			slot.close()
+
+	def get_stats(self):
+		with self.lock:
+			slots = dict(self.slots)
+		return {cameraID: slot.get_stats() for (cameraID, slot) in slots.items()}
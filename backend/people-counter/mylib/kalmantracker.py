@@ -0,0 +1,150 @@
+# import the necessary packages
+from mylib.postprocess import iou_matrix
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+
+def boxes_to_z(boxes):
+	# convert boxes to the measurement (centerX, centerY, area, aspect)
+	boxes = boxes.astype("float32")
+	w = boxes[:, 2] - boxes[:, 0]
+	h = boxes[:, 3] - boxes[:, 1]
+	return np.stack([boxes[:, 0] + w / 2.0, boxes[:, 1] + h / 2.0,
+		w * h, w / np.maximum(h, 1e-6)], axis=1)
+
+def x_to_boxes(x):
+	# convert filter states back to (startX, startY, endX, endY) boxes
+	area = np.maximum(x[:, 2], 1e-6)
+	w = np.sqrt(area * np.maximum(x[:, 3], 1e-6))
+	h = area / w
+	return np.stack([x[:, 0] - w / 2.0, x[:, 1] - h / 2.0,
+		x[:, 0] + w / 2.0, x[:, 1] + h / 2.0], axis=1)
+
+class KalmanTrackerEngine:
+
+	"""
+	A SORT-style tracking engine: every person is a constant-velocity
+	Kalman filter over (centerX, centerY, area, aspect) that is only
+	predicted between detection frames, so no image is touched. On a
+	detection frame the predictions are matched to the detections by
+	IoU with an optimal assignment, falling back to the center distance
+	for pairs that no longer overlap (detections are sparse, so a new
+	track has moved a lot before its velocity is known). All filters of
+	a camera are kept in stacked arrays and stepped together.
+
+	"""
+	def __init__(self, iouThresh=0.3, maxDistance=1.0, maxAge=2):
+		# store the minimum IoU for a prediction and a detection to be
+		# the same person, the maximum distance between their centers
+		# (in box heights) when they do not overlap enough, and the
+		# number of detection frames a track may go unmatched before it
+		# is dropped
+		self.iouThresh = iouThresh
+		self.maxDistance = maxDistance
+		self.maxAge = maxAge
+
+		# the constant velocity model: the center and the area move by
+		# their velocity every frame, the aspect ratio stays constant
+		self.F = np.eye(7, dtype="float32")
+		self.F[0, 4] = self.F[1, 5] = self.F[2, 6] = 1.0
+		self.Hm = np.eye(4, 7, dtype="float32")
+
+		# process, measurement and initial covariances as used by SORT
+		self.Q = np.eye(7, dtype="float32")
+		self.Q[-1, -1] *= 0.01
+		self.Q[4:, 4:] *= 0.01
+		self.R = np.eye(4, dtype="float32")
+		self.R[2:, 2:] *= 10.0
+		self.P0 = np.eye(7, dtype="float32") * 10.0
+		self.P0[4:, 4:] *= 100.0
+
+		# the stacked filter states and covariances, along with the
+		# number of detection frames each track went unmatched
+		self.x = np.zeros((0, 7), dtype="float32")
+		self.P = np.zeros((0, 7, 7), dtype="float32")
+		self.misses = np.zeros((0,), dtype="int32")
+
+		# counters for the throughput comparison
+		self.stats = {"predictions": 0, "matched": 0, "created": 0, "retired": 0}
+
+	def _predict(self):
+		# step every filter forward by one frame
+		if len(self.x) == 0:
+			return
+
+		# stop a shrinking box before its area turns negative
+		self.x[self.x[:, 2] + self.x[:, 6] <= 0, 6] = 0.0
+		self.x = self.x @ self.F.T
+		self.P = self.F @ self.P @ self.F.T + self.Q
+		self.stats["predictions"] += len(self.x)
+
+	def _correct(self, idx, z):
+		# the batched Kalman update of the matched filters
+		Hm = self.Hm
+		P = self.P[idx]
+		S = Hm @ P @ Hm.T + self.R
+		K = P @ Hm.T @ np.linalg.inv(S)
+		y = z - self.x[idx] @ Hm.T
+		self.x[idx] += np.einsum("nij,nj->ni", K, y)
+		self.P[idx] = (np.eye(7, dtype="float32") - K @ Hm) @ P
+
+	def detect(self, boxes, pipeline=None):
+		# predict the tracks to the current frame and match them to the
+		# new detections
+		self._predict()
+		boxes = np.asarray(boxes, dtype="int32").reshape(-1, 4)
+		matched = np.zeros(len(boxes), dtype="bool")
+
+		if len(self.x) > 0 and len(boxes) > 0:
+			# score every pair by its overlap, penalized by the distance
+			# between the centers relative to the predicted box height
+			predicted = x_to_boxes(self.x)
+			iou = iou_matrix(predicted, boxes)
+			z = boxes_to_z(boxes)
+			heights = np.maximum(predicted[:, 3] - predicted[:, 1], 1.0)
+			dist = np.linalg.norm(self.x[:, None, :2] - z[None, :, :2], axis=2) / heights[:, None]
+			valid = (iou >= self.iouThresh) | (dist <= self.maxDistance)
+			cost = np.where(valid, dist - iou, 1e6)
+
+			(rows, cols) = linear_sum_assignment(cost)
+			keep = valid[rows, cols]
+			(rows, cols) = (rows[keep], cols[keep])
+
+			self._correct(rows, z[cols])
+			self.misses += 1
+			self.misses[rows] = 0
+			matched[cols] = True
+			self.stats["matched"] += len(rows)
+		else:
+			self.misses += 1
+
+		# drop the tracks that went unmatched for too long
+		alive = self.misses <= self.maxAge
+		self.stats["retired"] += int((~alive).sum())
+		(self.x, self.P, self.misses) = (self.x[alive], self.P[alive], self.misses[alive])
+
+		# start a new filter for every unmatched detection
+		new = boxes[~matched]
+		if len(new) > 0:
+			x = np.zeros((len(new), 7), dtype="float32")
+			x[:, :4] = boxes_to_z(new)
+			self.x = np.concatenate([self.x, x])
+			self.P = np.concatenate([self.P, np.repeat(self.P0[None], len(new), axis=0)])
+			self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype="int32")])
+			self.stats["created"] += len(new)
+
+		return self.boxes()
+
+	def track(self, pipeline=None):
+		# between detections the filters are only predicted, the
+		# model has no appearance so every track is fully "confident"
+		self._predict()
+		return (self.boxes(), [])
+
+	def boxes(self):
+		return x_to_boxes(self.x).round().astype("int32")
+
+	def __len__(self):
+		return len(self.x)
+
+	def get_stats(self):
+		return dict(self.stats, engine="kalman", tracks=len(self.x))
@@ -0,0 +1,160 @@
+# import the necessary packages
+import numpy as np
+import cv2
+
+class CountingLines:
+
+	"""
+	Counts people crossing any number of counting lines or polylines of
+	one camera. Every frame the movement of all tracks since the previous
+	frame is tested against every line segment at once; a crossing in the
+	direction of the segment normal (the left-hand side of the segment
+	when walking from its first point to the next, i.e. "down" for a
+	horizontal line drawn left to right) is an "in" event, a crossing
+	the other way an "out" event. A crossing only counts once the track
+	is more than margin pixels past the line, so a person standing on it
+	is not counted back and forth, and a track is never counted twice in
+	a row in the same direction on the same line.
+
+	"""
+	def __init__(self, lines=None, W=500, H=375, margin=8):
+		# by default a single horizontal line through the middle of the
+		# frame, like the original border
+		if not lines:
+			lines = [{"name": "entrance", "points": [[0.0, 0.5], [1.0, 0.5]]}]
+
+		# store the names and the pixel polylines of the lines, given as
+		# fractions of the frame size
+		self.names = []
+		self.polylines = []
+		(starts, ends, owners) = ([], [], [])
+		for (i, line) in enumerate(lines):
+			points = np.asarray(line["points"], dtype="float") * [W, H]
+			self.names.append(line.get("name", "line{}".format(i)))
+			self.polylines.append(points.round().astype("int32"))
+			starts.append(points[:-1])
+			ends.append(points[1:])
+			owners.append(np.full(len(points) - 1, i))
+
+		# the segments of every line in one array, along with the index
+		# of the line each one belongs to and their lengths
+		self.A = np.concatenate(starts)
+		self.B = np.concatenate(ends)
+		self.owner = np.concatenate(owners)
+		self.D = self.B - self.A
+		self.length = np.maximum(np.hypot(self.D[:, 0], self.D[:, 1]), 1e-6)
+
+		# store the distance (in pixels) a track has to get past a line
+		# before its crossing counts
+		self.margin = margin
+
+		# per track, sorted by ID: the previous centroid, the side of
+		# every segment it was last seen beyond the margin on (+1, -1 or
+		# 0 if never), the side it has crossed to but not yet got the
+		# margin past, and the last direction counted on every line
+		self.prevIDs = np.zeros((0,), dtype="int")
+		self.prevPts = np.zeros((0, 2), dtype="float")
+		self.armed = np.zeros((0, len(self.A)), dtype="int8")
+		self.pending = np.zeros((0, len(self.A)), dtype="int8")
+		self.last = np.zeros((0, len(self.names)), dtype="int8")
+
+		# the number of in and out events per line
+		self.entered = np.zeros(len(self.names), dtype="int")
+		self.exited = np.zeros(len(self.names), dtype="int")
+
+	def _side(self, P):
+		# the signed distance of every point to every segment, positive
+		# on the side the segment normal points to
+		A = self.A[None, :, :]
+		D = self.D[None, :, :]
+		return (D[..., 0] * (P[:, None, 1] - A[..., 1]) - D[..., 1] * (P[:, None, 0] - A[..., 0])) / self.length
+
+	def update(self, ids, centroids):
+		# grab the previous centroid and state of every track that has
+		# one, new tracks start out on the side they are on
+		ids = np.asarray(ids, dtype="int")
+		pts = np.asarray(centroids, dtype="float").reshape(-1, 2)
+		idx = np.searchsorted(self.prevIDs, ids)
+		idx = np.minimum(idx, max(len(self.prevIDs) - 1, 0))
+		known = (self.prevIDs[idx] == ids) if len(self.prevIDs) > 0 else np.zeros(len(ids), dtype="bool")
+
+		distance = self._side(pts)
+		side = np.where(distance > self.margin, 1, np.where(distance < -self.margin, -1, 0)).astype("int8")
+		armed = side.copy()
+		pending = np.zeros(side.shape, dtype="int8")
+		last = np.zeros((len(ids), len(self.names)), dtype="int8")
+		armed[known] = self.armed[idx[known]]
+		pending[known] = self.pending[idx[known]]
+		last[known] = self.last[idx[known]]
+
+		# a known track crosses a segment if it moved from one side of
+		# the segment to the other and the segment end points lie on
+		# different sides of its movement (split half-open, negative
+		# vs. the rest)
+		(P0, P1) = (self.prevPts[idx[known]], pts[known])
+		if len(P1) > 0:
+			before = self._side(P0)
+			after = distance[known]
+			M = (P1 - P0)[:, None, :]
+			A = self.A[None, :, :]
+			B = self.B[None, :, :]
+			sideA = M[..., 0] * (A[..., 1] - P0[:, None, 1]) - M[..., 1] * (A[..., 0] - P0[:, None, 0])
+			sideB = M[..., 0] * (B[..., 1] - P0[:, None, 1]) - M[..., 1] * (B[..., 0] - P0[:, None, 0])
+			straddle = (sideA < 0) != (sideB < 0)
+			crossed = pending[known]
+			crossed[straddle & (before < 0) & (after >= 0)] = 1
+			crossed[straddle & (before >= 0) & (after < 0)] = -1
+			pending[known] = crossed
+
+		# a crossing counts once the track is past the margin on the side
+		# it crossed to, and any track past the margin re-arms on its side
+		beyond = side != 0
+		fired = beyond & (pending == side) & (armed != side)
+		armed[beyond] = side[beyond]
+		pending[beyond] = 0
+
+		# count at most one event per track and line, and never the same
+		# direction twice in a row
+		events = []
+		for (row, seg) in zip(*np.nonzero(fired)):
+			line = self.owner[seg]
+			direction = side[row, seg]
+			if last[row, line] == direction:
+				continue
+			last[row, line] = direction
+			if direction > 0:
+				self.entered[line] += 1
+			else:
+				self.exited[line] += 1
+			events.append({"line": self.names[line], "object_id": int(ids[row]),
+				"direction": "in" if direction > 0 else "out"})
+
+		# remember the current centroids and states for the next frame
+		# (the tracks the centroid tracker dropped simply fall out)
+		order = np.argsort(ids, kind="stable")
+		(self.prevIDs, self.prevPts) = (ids[order], pts[order])
+		(self.armed, self.pending, self.last) = (armed[order], pending[order], last[order])
+		return events
+
+	def distance(self, points):
+		# the distance of every point to the nearest line segment
+		P = np.asarray(points, dtype="float").reshape(-1, 2)[:, None, :]
+		t = ((P - self.A[None]) * self.D[None]).sum(axis=2) / self.length ** 2
+		closest = self.A[None] + np.clip(t, 0.0, 1.0)[..., None] * self.D[None]
+		return np.hypot(*(P - closest).transpose(2, 0, 1)).min(axis=1)
+
+	def totals(self):
+		# the number of people that went in and out over all lines
+		return (int(self.entered.sum()), int(self.exited.sum()))
+
+	def draw(self, frame, color=(0, 0, 0)):
+		# draw every line along with its name at its first point
+		for (name, points) in zip(self.names, self.polylines):
+			cv2.polylines(frame, [points], False, color, 3)
+			(x, y) = points[0]
+			cv2.putText(frame, name, (int(x) + 5, int(y) - 5),
+				cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+	def get_stats(self):
+		return {name: {"in": int(i), "out": int(o)}
+			for (name, i, o) in zip(self.names, self.entered, self.exited)}
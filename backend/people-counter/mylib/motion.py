@@ -0,0 +1,102 @@
+# import the necessary packages
+import numpy as np
+import cv2
+
+class MotionGate:
+
+	"""
+	A cheap motion detector run on a small grayscale copy of every
+	frame. While nothing moves in the scene (or in the band around the
+	counting lines) for longer than holdFrames, the camera is idle and
+	the pipeline can skip the detector and trackers entirely.
+
+	"""
+	def __init__(self, width=160, threshold=25, minArea=0.002,
+		holdFrames=60, alpha=0.05, band=None, line=0.5):
+		# store the width of the downscaled frame, the per-pixel
+		# intensity change that counts as motion and the fraction of
+		# the region that has to change before the scene is "moving"
+		self.width = width
+		self.threshold = threshold
+		self.minArea = minArea
+
+		# store how many frames the camera stays active after the last
+		# motion and the learning rate of the running background
+		self.holdFrames = holdFrames
+		self.alpha = alpha
+
+		# optionally restrict the gate to a band around the counting
+		# line, both given as fractions of the frame height (a horizontal
+		# line until the real lines are set)
+		self.band = band
+		self.line = line
+		self.lines = None
+
+		# initialize the background model and the bookkeeping
+		self.background = None
+		self.frames = 0
+		self.lastMotion = None
+		self.idleFrames = 0
+		self.inferencesSaved = 0
+
+	def update(self, frame):
+		# downscale the frame, convert it to grayscale and blur it to
+		# suppress sensor noise
+		(h, w) = frame.shape[:2]
+		height = max(1, int(h * self.width / float(w)))
+		small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+		gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+		gray = cv2.GaussianBlur(gray, (5, 5), 0)
+		self.frames += 1
+
+		# the first frame seeds the background and counts as motion so
+		# the camera starts out active
+		if self.background is None:
+			self.background = gray.astype("float32")
+			self.lastMotion = self.frames
+			return True
+
+		# compare the frame against the running background, then
+		# blend the frame into the background
+		delta = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+		cv2.accumulateWeighted(gray, self.background, self.alpha)
+
+		# crop the difference image to the band around the counting lines
+		if self.band is not None and self.lines is not None:
+			pad = self.band * height
+			(x0, y0, x1, y1) = self.lines * [self.width, height, self.width, height]
+			delta = delta[max(0, int(y0 - pad)):min(height, int(y1 + pad) + 1),
+				max(0, int(x0 - pad)):min(self.width, int(x1 + pad) + 1)]
+		elif self.band is not None:
+			y0 = max(0, int((self.line - self.band) * height))
+			y1 = min(height, int((self.line + self.band) * height) + 1)
+			delta = delta[y0:y1]
+
+		# count the pixels that changed enough to be considered motion
+		mask = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+		if cv2.countNonZero(mask) > self.minArea * mask.size:
+			self.lastMotion = self.frames
+
+		if not self.active:
+			self.idleFrames += 1
+		return self.active
+
+	def set_lines(self, polylines, W, H):
+		# follow the counting lines of the camera, kept as the fractions
+		# of the frame their bounding box covers
+		points = np.concatenate([np.asarray(p, dtype="float") for p in polylines])
+		self.lines = np.r_[points.min(axis=0), points.max(axis=0)] / [W, H, W, H]
+
+	@property
+	def active(self):
+		# the camera stays active for holdFrames after the last motion
+		return self.lastMotion is not None and \
+			self.frames - self.lastMotion <= self.holdFrames
+
+	def get_stats(self):
+		return {
+			"active": self.active,
+			"frames": self.frames,
+			"idle_frames": self.idleFrames,
+			"inferences_saved": self.inferencesSaved,
+		}
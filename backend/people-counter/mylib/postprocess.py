@@ -0,0 +1,87 @@
+# import the necessary packages
+import numpy as np
+
+# initialize the list of class labels MobileNet SSD was trained to detect
+CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
+	"bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
+	"dog", "horse", "motorbike", "person", "pottedplant", "sheep",
+	"sofa", "train", "tvmonitor"]
+
+PERSON = CLASSES.index("person")
+
+def iou_matrix(a, b):
+	# compute the intersection over union of every box in a with
+	# every box in b, both given as (startX, startY, endX, endY) rows
+	a = a.astype("float32")[:, None, :]
+	b = b.astype("float32")[None, :, :]
+	w = np.maximum(0, np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]))
+	h = np.maximum(0, np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]))
+	inter = w * h
+	areaA = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+	areaB = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+	return inter / np.maximum(areaA + areaB - inter, 1e-6)
+
+def non_max_suppression(boxes, scores, overlapThresh=0.3):
+	# if there are no boxes, return an empty list of indexes
+	if len(boxes) == 0:
+		return np.empty((0,), dtype="int")
+
+	# grab the coordinates of the bounding boxes and compute their
+	# areas, then sort the boxes by score (highest first)
+	boxes = boxes.astype("float")
+	(x1, y1, x2, y2) = (boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+	area = (x2 - x1 + 1) * (y2 - y1 + 1)
+	idxs = np.argsort(scores)[::-1]
+	pick = []
+
+	# keep looping while some indexes still remain in the list
+	while len(idxs) > 0:
+		# keep the highest scoring box that is left
+		i = idxs[0]
+		pick.append(i)
+
+		# compute the overlap between the picked box and every other
+		# remaining box
+		xx1 = np.maximum(x1[i], x1[idxs[1:]])
+		yy1 = np.maximum(y1[i], y1[idxs[1:]])
+		xx2 = np.minimum(x2[i], x2[idxs[1:]])
+		yy2 = np.minimum(y2[i], y2[idxs[1:]])
+		w = np.maximum(0, xx2 - xx1 + 1)
+		h = np.maximum(0, yy2 - yy1 + 1)
+		inter = w * h
+		iou = inter / (area[i] + area[idxs[1:]] - inter)
+
+		# drop every box that overlaps the picked one too much
+		idxs = idxs[1:][iou <= overlapThresh]
+
+	return np.array(pick, dtype="int")
+
+def decode_detections(detections, W, H, confidence=0.4, classID=PERSON,
+	overlapThresh=None, returnScores=False):
+	# the raw SSD output has shape (1, 1, N, 7) where every row is
+	# (image, class, confidence, startX, startY, endX, endY) with the
+	# coordinates normalized to [0, 1]
+	rows = detections.reshape(-1, 7)
+
+	# filter out weak detections and every class other than the one
+	# we are interested in with a single mask
+	mask = (rows[:, 2] > confidence) & (rows[:, 1].astype("int") == classID)
+	rows = rows[mask]
+	scores = rows[:, 2]
+
+	# scale every bounding box to the frame dimensions in one go and
+	# clip the boxes so they stay inside the frame
+	boxes = rows[:, 3:7] * np.array([W, H, W, H], dtype="float32")
+	boxes = boxes.astype("int32")
+	np.clip(boxes[:, 0::2], 0, W - 1, out=boxes[:, 0::2])
+	np.clip(boxes[:, 1::2], 0, H - 1, out=boxes[:, 1::2])
+
+	# optionally suppress overlapping boxes of the same person
+	if overlapThresh is not None and len(boxes) > 1:
+		pick = non_max_suppression(boxes, scores, overlapThresh)
+		boxes = boxes[pick]
+		scores = scores[pick]
+
+	if returnScores:
+		return (boxes, scores)
+	return boxes
@@ -0,0 +1,127 @@
+# import the necessary packages
+import numpy as np
+import cv2
+
+class DetectionRegion:
+
+	"""
+	The part of the frame the detector is run on: either a band around
+	the counting lines (their bounding box grown by the band) or a
+	polygon, both given as fractions of the frame size. Detections are
+	found on the crop and mapped back to frame coordinates.
+
+	"""
+	def __init__(self, band=None, polygon=None, line=0.5, fill=127):
+		# store the half-height of the band around the counting line
+		# (as a fraction of the frame height), or the polygon as a list
+		# of (x, y) fractions of the frame width and height
+		self.band = band
+		self.polygon = polygon
+		self.line = line
+
+		# the pixel polylines of the counting lines, once they are known
+		# (until then a horizontal line at the given height is assumed)
+		self.lines = None
+
+		# pixels outside the polygon are painted with the blob mean so
+		# they become zero once the network input is normalized
+		self.fill = fill
+
+		# the crop rectangle and polygon mask are computed once the
+		# frame size is known
+		self.size = None
+		self.rect = None
+		self.outside = None
+
+	def _prepare(self, W, H):
+		self.size = (W, H)
+
+		if self.polygon is not None:
+			# scale the polygon to pixels and crop to its bounding box
+			pts = np.array(self.polygon, dtype="float32") * np.array([W, H], dtype="float32")
+			pts = pts.round().astype("int32")
+			(x, y, w, h) = cv2.boundingRect(pts)
+			x0 = max(0, x)
+			y0 = max(0, y)
+			x1 = min(W, x + w)
+			y1 = min(H, y + h)
+
+			# rasterize the polygon into a mask of the crop so pixels
+			# outside of it can be blanked before detection
+			mask = np.zeros((y1 - y0, x1 - x0), dtype="uint8")
+			cv2.fillPoly(mask, [pts - np.array([x0, y0], dtype="int32")], 255)
+			self.outside = mask == 0
+
+		elif self.band is not None and self.lines is not None:
+			# crop the bounding box of the counting lines grown by the band
+			pad = self.band * H
+			points = np.concatenate(self.lines)
+			x0 = max(0, int(points[:, 0].min() - pad))
+			y0 = max(0, int(points[:, 1].min() - pad))
+			x1 = min(W, int(points[:, 0].max() + pad) + 1)
+			y1 = min(H, int(points[:, 1].max() + pad) + 1)
+
+		elif self.band is not None:
+			# crop every row within the band around the counting line
+			(x0, x1) = (0, W)
+			y0 = max(0, int((self.line - self.band) * H))
+			y1 = min(H, int((self.line + self.band) * H))
+
+		else:
+			(x0, y0, x1, y1) = (0, 0, W, H)
+
+		self.rect = (x0, y0, x1, y1)
+
+	def set_lines(self, polylines):
+		# follow the counting lines of the camera (in frame pixels)
+		self.lines = [np.asarray(points) for points in polylines]
+		(self.size, self.rect) = (None, None)
+
+	def crop(self, frame):
+		# return the part of the frame the detector should look at
+		(H, W) = frame.shape[:2]
+		if self.size != (W, H):
+			self._prepare(W, H)
+
+		(x0, y0, x1, y1) = self.rect
+		crop = frame[y0:y1, x0:x1]
+
+		if self.outside is not None:
+			crop = crop.copy()
+			crop[self.outside] = self.fill
+		return crop
+
+	def to_frame(self, boxes):
+		# shift boxes found on the crop back into frame coordinates and,
+		# for a polygon, drop every box whose center lies outside of it
+		if len(boxes) == 0:
+			return boxes
+
+		(x0, y0) = self.rect[:2]
+		if self.outside is not None:
+			cX = (boxes[:, 0] + boxes[:, 2]) // 2
+			cY = (boxes[:, 1] + boxes[:, 3]) // 2
+			cX = np.clip(cX, 0, self.outside.shape[1] - 1)
+			cY = np.clip(cY, 0, self.outside.shape[0] - 1)
+			boxes = boxes[~self.outside[cY, cX]]
+
+		return boxes + np.array([x0, y0, x0, y0], dtype=boxes.dtype)
+
+	@property
+	def full(self):
+		# True when the region covers the whole frame
+		return self.polygon is None and self.band is None
+
+	def get_stats(self):
+		# nothing to report until the next crop prepares the region again
+		if self.rect is None or self.size is None:
+			return {}
+
+		(x0, y0, x1, y1) = self.rect
+		(W, H) = self.size
+		pixels = (x1 - x0) * (y1 - y0)
+		return {
+			"roi_pixels": pixels,
+			"frame_pixels": W * H,
+			"roi_fraction": round(pixels / float(W * H), 3),
+		}
@@ -0,0 +1,233 @@
+# import the necessary packages
+import logging, multiprocessing, os, threading, time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# the host CPU load is shared by every camera, so it is sampled at most
+# once a second and cached between calls
+_load = {"sampled": 0.0, "value": 0.0}
+_loadLock = threading.Lock()
+
+def cpu_load():
+	# return the 1-minute load average normalized by the number of
+	# cores (0.0 is an idle host, 1.0 a fully busy one)
+	with _loadLock:
+		now = time.time()
+		if now - _load["sampled"] >= 1.0:
+			try:
+				_load["value"] = os.getloadavg()[0] / (os.cpu_count() or 1)
+			except (AttributeError, OSError):
+				_load["value"] = 0.0
+			_load["sampled"] = now
+		return _load["value"]
+
+class DetectionScheduler:
+
+	"""
+	Picks the number of frames between two detections for one camera
+	from what its trackers are doing: busy scenes, drifting trackers
+	and people close to the counting lines shorten the interval, empty
+	scenes and a loaded host lengthen it.
+
+	"""
+	def __init__(self, cameraID, baseInterval=30, minInterval=5,
+		maxInterval=90, minPSR=7.0, lineMargin=0.15, busyTracks=8,
+		cpuHigh=0.85, adaptive=True):
+		# store the camera the scheduler belongs to along with the
+		# base interval (the old --skip-frames value) and its bounds
+		self.cameraID = cameraID
+		self.baseInterval = baseInterval
+		self.minInterval = min(minInterval, baseInterval)
+		self.maxInterval = max(maxInterval, baseInterval)
+
+		# store the peak-to-sidelobe ratio below which a dlib tracker is
+		# considered lost, the fraction of the frame height around the
+		# counting lines that counts as "close", the number of tracks
+		# that makes a scene busy and the normalized load above which
+		# the host is short on CPU
+		self.minPSR = minPSR
+		self.lineMargin = lineMargin
+		self.busyTracks = busyTracks
+		self.cpuHigh = cpuHigh
+		self.adaptive = adaptive
+
+		# initialize the current interval, the frames since the last
+		# detection and the counters used for the effective rate
+		self.interval = baseInterval
+		self.reason = "base"
+		self.sinceDetection = None
+		self.phase = 0.0
+		self.frames = 0
+		self.detections = 0
+		self.skips = 0
+
+	def should_detect(self):
+		# the very first frame runs the detector unless a phase has been
+		# assigned, after that we wait for the current interval to elapse
+		self.frames += 1
+		if self.sinceDetection is None:
+			return True
+		self.sinceDetection += 1
+		return self.sinceDetection >= self.interval
+
+	def detected(self):
+		# reset the countdown after the detector has run
+		self.sinceDetection = 0
+		self.detections += 1
+
+	def skipped(self):
+		# a due detection was skipped (the scene is idle): wait a full
+		# interval for the next slot without counting a detection
+		self.sinceDetection = 0
+		self.skips += 1
+
+	def set_phase(self, phase):
+		# move the next detection to the given fraction of the current
+		# interval from now, so cameras given different phases do not
+		# run the detector on the same tick
+		self.phase = phase
+		offset = int(round(phase * self.interval))
+		self.sinceDetection = self.interval - offset
+
+	def update(self, rects, psrs, lines, H):
+		# a fixed scheduler keeps the base interval
+		if not self.adaptive:
+			return self.interval
+
+		(interval, reason) = self._choose(rects, psrs, lines, H)
+		return self._set(interval, reason)
+
+	def hold(self, reason):
+		# keep the base interval whatever the scene looks like, e.g.
+		# while a crowd is counted without tracking
+		return self._set(self.baseInterval, reason)
+
+	def _set(self, interval, reason):
+		interval = int(max(self.minInterval, min(self.maxInterval, interval)))
+
+		# log every change so the effective detection rate per camera
+		# can be followed
+		if interval != self.interval:
+			logger.info("camera %s: detection interval %d -> %d (%s)",
+				self.cameraID, self.interval, interval, reason)
+		self.interval = interval
+		self.reason = reason
+		return interval
+
+	def _choose(self, rects, psrs, lines, H):
+		# a tracker that has lost its target needs a new detection
+		# right away
+		if len(psrs) > 0 and min(psrs) < self.minPSR:
+			return (self.minInterval, "tracker drift")
+
+		# with nobody in view, detect rarely
+		if len(rects) == 0:
+			interval = self.maxInterval
+			reason = "no tracks"
+
+		# otherwise shorten the interval as the scene gets busier, and
+		# halve it again when someone is about to cross the line
+		else:
+			interval = self.baseInterval / (1.0 + len(rects) / float(self.busyTracks))
+			reason = "{} tracks".format(len(rects))
+
+			boxes = np.asarray(rects, dtype="float").reshape(-1, 4)
+			centroids = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+			if (lines.distance(centroids) < self.lineMargin * H).any():
+				interval /= 2.0
+				reason += ", near line"
+
+		# back off when the host is running out of CPU
+		if cpu_load() > self.cpuHigh:
+			interval *= 2.0
+			reason += ", cpu busy"
+
+		return (interval, reason)
+
+	def get_stats(self):
+		rate = self.detections / float(self.frames) if self.frames else 0.0
+		return {
+			"interval": self.interval,
+			"phase": round(self.phase, 3),
+			"reason": self.reason,
+			"detections": self.detections,
+			"skipped": self.skips,
+			"detection_rate": round(rate, 4),
+		}
+
+class PhaseAssigner:
+
+	"""
+	Spreads the detection slots of every camera on the host evenly
+	across the detection interval, and re-balances them whenever a
+	camera is added or removed.
+
+	"""
+	def __init__(self):
+		# the schedulers are kept in the order their cameras were added
+		self.lock = threading.Lock()
+		self.schedulers = {}
+
+	def add(self, cameraID, scheduler):
+		with self.lock:
+			self.schedulers[cameraID] = scheduler
+			self._rebalance()
+
+	def remove(self, cameraID):
+		with self.lock:
+			if self.schedulers.pop(cameraID, None) is not None:
+				self._rebalance()
+
+	def _rebalance(self):
+		# give the i-th of n cameras the phase i / n
+		n = len(self.schedulers)
+		for (i, scheduler) in enumerate(self.schedulers.values()):
+			scheduler.set_phase(i / float(n))
+		logger.info("re-balanced detection phases across %d cameras", n)
+
+class RemotePhase:
+
+	"""
+	Stands in for the scheduler of a camera that runs in a worker
+	process: the PhaseAssigner of the main process sets its phase in a
+	shared value, which a PhaseFollower in the worker hands on to the
+	real scheduler.
+
+	"""
+	def __init__(self):
+		self.value = multiprocessing.get_context("spawn").Value("d", 0.0)
+
+	def set_phase(self, phase):
+		self.value.value = phase
+
+class PhaseFollower:
+
+	"""
+	Takes the place of the PhaseAssigner in a camera worker process and
+	keeps the scheduler of its camera on the phase the main process
+	assigned, checking the shared value every interval seconds.
+
+	"""
+	def __init__(self, value, interval=0.5):
+		self.value = value
+		self.interval = interval
+		self.stopped = threading.Event()
+		self.thread = None
+
+	def add(self, cameraID, scheduler):
+		scheduler.set_phase(self.value.value)
+		self.thread = threading.Thread(target=self._follow, args=(scheduler,),
+			name="phase-{}".format(cameraID), daemon=True)
+		self.thread.start()
+
+	def _follow(self, scheduler):
+		phase = scheduler.phase
+		while not self.stopped.wait(self.interval):
+			if self.value.value != phase:
+				phase = self.value.value
+				scheduler.set_phase(phase)
+				logger.info("camera %s: detection phase set to %.3f", scheduler.cameraID, phase)
+
+	def remove(self, cameraID):
+		self.stopped.set()
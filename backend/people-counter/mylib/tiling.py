@@ -0,0 +1,96 @@
+# import the necessary packages
+from mylib.postprocess import decode_detections, non_max_suppression
+import numpy as np
+import cv2
+
+class TileGrid:
+
+	"""
+	Splits a full resolution frame into a grid of overlapping tiles so
+	that small, distant people are still large enough for the detector
+	once every tile is scaled down to the detector width. The detections
+	of all tiles are merged with a cross-tile non-maximum suppression.
+
+	"""
+	def __init__(self, cols=2, rows=2, overlap=0.2, tileWidth=500):
+		# store the grid size, the fraction of a tile that overlaps its
+		# neighbours and the width every tile is resized to
+		self.cols = cols
+		self.rows = rows
+		self.overlap = overlap
+		self.tileWidth = tileWidth
+
+		# the tile rectangles are computed once the frame size is known
+		self.size = None
+		self.rects = []
+
+		# running number of runs and mean time (in milliseconds) of the
+		# tiled detections and of the single-shot reference detections
+		self.timing = {"tiled": [0, 0.0], "single": [0, 0.0]}
+
+	def _prepare(self, W, H):
+		self.size = (W, H)
+
+		# every tile is enlarged by the overlap so people standing on
+		# a seam are seen whole by at least one tile
+		tileW = W / float(self.cols)
+		tileH = H / float(self.rows)
+		padW = tileW * self.overlap / 2.0
+		padH = tileH * self.overlap / 2.0
+
+		self.rects = []
+		for row in range(self.rows):
+			for col in range(self.cols):
+				x0 = int(max(0, col * tileW - padW))
+				y0 = int(max(0, row * tileH - padH))
+				x1 = int(min(W, (col + 1) * tileW + padW))
+				y1 = int(min(H, (row + 1) * tileH + padH))
+				self.rects.append((x0, y0, x1, y1))
+
+	def split(self, frame):
+		# cut the frame into tiles and resize all of them to the same
+		# size so they can be passed through the network as one batch
+		(H, W) = frame.shape[:2]
+		if self.size != (W, H):
+			self._prepare(W, H)
+
+		(x0, y0, x1, y1) = self.rects[0]
+		tileH = int((y1 - y0) * self.tileWidth / float(x1 - x0))
+		return [cv2.resize(frame[y0:y1, x0:x1], (self.tileWidth, tileH),
+			interpolation=cv2.INTER_AREA) for (x0, y0, x1, y1) in self.rects]
+
+	def merge(self, detections, scale, confidence=0.4, overlapThresh=0.3):
+		# decode the detections of every tile in its own rectangle of
+		# the full resolution frame, then scale them to the processing
+		# frame with the given factor
+		allBoxes = []
+		allScores = []
+		for (tile, (x0, y0, x1, y1)) in zip(detections, self.rects):
+			(boxes, scores) = decode_detections(tile, x1 - x0, y1 - y0,
+				confidence, returnScores=True)
+			allBoxes.append(boxes + np.array([x0, y0, x0, y0], dtype="int32"))
+			allScores.append(scores)
+
+		boxes = np.concatenate(allBoxes).astype("float32") * scale
+		scores = np.concatenate(allScores)
+
+		# the same person is usually found by two tiles around a seam,
+		# so suppress the overlapping boxes across tiles
+		pick = non_max_suppression(boxes, scores, overlapThresh)
+		return boxes[pick].astype("int32")
+
+	def record(self, kind, seconds):
+		# fold one timing ("tiled" or "single") into its running mean
+		t = self.timing[kind]
+		t[0] += 1
+		t[1] += (seconds * 1000.0 - t[1]) / t[0]
+
+	def get_stats(self):
+		(tiled, single) = (self.timing["tiled"], self.timing["single"])
+		return {
+			"grid": [self.cols, self.rows],
+			"overlap": self.overlap,
+			"tiled_ms": round(tiled[1], 2),
+			"single_ms": round(single[1], 2),
+			"cost_ratio": round(tiled[1] / single[1], 2) if single[1] else None,
+		}
@@ -1,10 +1,48 @@
+# import the necessary packages
+import numpy as np
+
 class TrackableObject:
-	def __init__(self, objectID, centroid):
-		# store the object ID, then initialize a list of centroids
-		# using the current centroid
+
+	"""
+	The counting state of one tracked person. Only the last maxHistory
+	centroids are kept, in a ring buffer, while the mean y-coordinate of
+	the whole trajectory is kept as a running sum so the direction test
+	costs the same on the first frame and the ten-thousandth.
+
+	"""
+	__slots__ = ("objectID", "history", "next", "sumY", "seen", "counted")
+
+	def __init__(self, objectID, centroid, maxHistory=32):
+		# store the object ID, then initialize the ring buffer of
+		# centroids and the running sum of their y-coordinates using
+		# the current centroid
 		self.objectID = objectID
-		self.centroids = [centroid]
+		self.history = np.zeros((maxHistory, 2), dtype="int")
+		self.next = 0
+		self.sumY = 0.0
+		self.seen = 0
+		self.append(centroid)
 
 		# initialize a boolean used to indicate if the object has
 		# already been counted or not
-		self.counted = False
\ No newline at end of file
+		self.counted = False
+
+	def append(self, centroid):
+		# overwrite the oldest centroid and add the y-coordinate to the
+		# running sum
+		self.history[self.next] = centroid[:2]
+		self.next = (self.next + 1) % len(self.history)
+		self.sumY += centroid[1]
+		self.seen += 1
+
+	@property
+	def meanY(self):
+		# the mean y-coordinate of every centroid seen so far
+		return self.sumY / self.seen
+
+	@property
+	def centroids(self):
+		# the most recent centroids, oldest first
+		if self.seen < len(self.history):
+			return self.history[:self.seen].copy()
+		return np.roll(self.history, -self.next, axis=0)
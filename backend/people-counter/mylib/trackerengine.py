@@ -0,0 +1,195 @@
+# import the necessary packages
+from mylib.kalmantracker import KalmanTrackerEngine
+from mylib.postprocess import iou_matrix
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+import dlib
+import cv2
+
+class UpdateBudget:
+
+	"""
+	Decides which trackers of a frame are worth a correlation update.
+	People close to a counting line or zone boundary, and people moving
+	fast, are updated every frame; everybody else only every k-th frame
+	and extrapolated with their last velocity in between. The distance
+	to the nearest boundary is looked up in a distance map computed once.
+
+	"""
+	def __init__(self, every=3, nearDistance=40, minSpeed=2.0):
+		# store how many frames a far and slow track may go without an
+		# update, the distance (in pixels) to a boundary within which a
+		# track is always updated, and the speed (in pixels per frame)
+		# from which it is always updated
+		self.every = every
+		self.nearDistance = nearDistance
+		self.minSpeed = minSpeed
+
+		# the distance of every pixel to the nearest boundary (None
+		# until the boundaries are known: every track counts as far)
+		self.distance = None
+
+	def set_boundaries(self, W, H, polylines=(), polygons=()):
+		# draw the counting lines and the zone outlines and compute the
+		# distance of every pixel to them
+		image = np.full((H, W), 255, dtype="uint8")
+		if len(polylines) > 0:
+			cv2.polylines(image, list(polylines), False, 0, 1)
+		if len(polygons) > 0:
+			cv2.polylines(image, list(polygons), True, 0, 1)
+		self.distance = cv2.distanceTransform(image, cv2.DIST_L2, 3)
+
+	def due(self, boxes, velocity, age):
+		# a track is due if it has waited long enough, moves fast or is
+		# close to a boundary
+		due = (age >= self.every) | (np.abs(velocity[:, :2]).max(axis=1) >= self.minSpeed)
+		if self.distance is not None:
+			(H, W) = self.distance.shape
+			x = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype("int"), 0, W - 1)
+			y = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype("int"), 0, H - 1)
+			due |= self.distance[y, x] <= self.nearDistance
+		return due
+
+class DlibTrackerEngine:
+
+	"""
+	The default tracking engine: one dlib correlation tracker per
+	detected person, updated on the tracker image of every frame. On a
+	detection frame the trackers are reconciled with the detections
+	instead of being rebuilt: a matched tracker is kept and only
+	re-seeded if it has drifted from its detection, new people get a
+	new tracker and trackers nobody matched are retired. With an update
+	budget, trackers far from the lines and zones only run every few
+	frames.
+
+	"""
+	def __init__(self, pool, scale=1.0, matchThresh=0.3, driftThresh=0.6, budget=None):
+		# store the worker pool that updates the trackers and the scale
+		# of the tracker image relative to the processing frame
+		self.pool = pool
+		self.scale = scale
+
+		# store the IoU a tracker needs with a detection to be the same
+		# person, and the IoU below which it is re-seeded on it
+		self.matchThresh = matchThresh
+		self.driftThresh = driftThresh
+
+		# store the optional update budget
+		self.budget = budget
+
+		# the trackers along with their last known boxes in processing
+		# frame coordinates (in the same order), and for the budget the
+		# velocity of every box, the frames since its tracker last ran
+		# and its last peak-to-sidelobe ratio
+		self.trackers = []
+		self.positions = np.zeros((0, 4), dtype="int32")
+		self.estimates = np.zeros((0, 4), dtype="float32")
+		self.velocity = np.zeros((0, 4), dtype="float32")
+		self.age = np.zeros((0,), dtype="int32")
+		self.psrs = np.zeros((0,), dtype="float32")
+		self.stats = {"updates": 0, "skipped": 0, "reused": 0, "reseeded": 0, "created": 0, "retired": 0}
+
+	def _start(self, tracker, box, rgb):
+		ts = self.scale
+		(startX, startY, endX, endY) = box
+		rect = dlib.rectangle(int(startX * ts), int(startY * ts), int(endX * ts), int(endY * ts))
+		tracker.start_track(rgb, rect)
+
+	def detect(self, boxes, pipeline):
+		boxes = np.asarray(boxes, dtype="int32").reshape(-1, 4)
+		matched = np.zeros(len(boxes), dtype="bool")
+		velocity = np.zeros((len(boxes), 4), dtype="float32")
+		trackers = []
+		rgb = None
+
+		# match the last tracker positions to the detections
+		if len(self.trackers) > 0 and len(boxes) > 0:
+			iou = iou_matrix(self.positions, boxes)
+			(rows, cols) = linear_sum_assignment(-iou)
+			keep = iou[rows, cols] >= self.matchThresh
+
+			for (row, col) in zip(rows[keep], cols[keep]):
+				tracker = self.trackers[row]
+
+				# a tracker that drifted off its person is re-seeded on
+				# the detection, the others are kept untouched
+				if iou[row, col] < self.driftThresh:
+					rgb = pipeline.tracker_image()
+					self._start(tracker, boxes[col], rgb)
+					self.stats["reseeded"] += 1
+				else:
+					self.stats["reused"] += 1
+
+				trackers.append((col, tracker))
+				matched[col] = True
+				velocity[col] = self.velocity[row]
+
+		self.stats["retired"] += len(self.trackers) - int(matched.sum())
+
+		# start a new correlation tracker for every unmatched detection
+		for col in np.flatnonzero(~matched):
+			rgb = rgb if rgb is not None else pipeline.tracker_image()
+			tracker = dlib.correlation_tracker()
+			self._start(tracker, boxes[col], rgb)
+			trackers.append((col, tracker))
+			self.stats["created"] += 1
+
+		# keep the trackers in the order of the detections so their
+		# positions line up with the boxes
+		trackers.sort(key=lambda t: t[0])
+		self.trackers = [tracker for (col, tracker) in trackers]
+		self.positions = boxes
+		self.estimates = boxes.astype("float32")
+		self.velocity = velocity
+		self.age = np.zeros(len(boxes), dtype="int32")
+		self.psrs = np.zeros(len(boxes), dtype="float32")
+		return boxes
+
+	def track(self, pipeline):
+		if not self.trackers:
+			return ([], [])
+
+		# without a budget every tracker runs on every frame
+		self.age += 1
+		if self.budget is None:
+			due = np.ones(len(self.trackers), dtype="bool")
+		else:
+			due = self.budget.due(self.estimates, self.velocity, self.age)
+
+		# the trackers that are not due move on with their velocity
+		self.estimates[~due] += self.velocity[~due]
+		self.stats["skipped"] += int((~due).sum())
+
+		# update the due trackers on the shared worker pool and scale
+		# their positions back to the processing frame
+		idx = np.flatnonzero(due)
+		if len(idx) > 0:
+			trackers = [self.trackers[i] for i in idx] if len(idx) < len(self.trackers) else self.trackers
+			(positions, psrs) = self.pool.update(trackers, pipeline.tracker_image())
+			positions /= self.scale
+			self.stats["updates"] += len(idx)
+
+			# the velocity is measured over the frames since the tracker
+			# last ran (on every frame without a budget, where it is not
+			# used)
+			last = self.estimates[idx] - self.velocity[idx] * (self.age[idx, None] - 1)
+			self.velocity[idx] = (positions - last) / self.age[idx, None]
+			self.estimates[idx] = positions
+			self.psrs[idx] = psrs
+			self.age[idx] = 0
+
+		self.positions = self.estimates.astype("int32")
+		return (self.positions, self.psrs.copy())
+
+	def __len__(self):
+		return len(self.trackers)
+
+	def get_stats(self):
+		return dict(self.stats, engine="dlib", tracks=len(self.trackers),
+			budget=self.budget is not None)
+
+def make_engine(name, pool, scale=1.0, budget=None):
+	# build the tracking engine a camera asked for
+	if name == "kalman":
+		return KalmanTrackerEngine()
+	return DlibTrackerEngine(pool, scale, budget=budget)
@@ -0,0 +1,55 @@
+# import the necessary packages
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class TrackerPool:
+
+	"""
+	Updates the dlib correlation trackers of a frame on a bounded pool
+	of worker threads. dlib releases the GIL while it works on the
+	image, so the per-person updates run concurrently. The positions
+	come back in a NumPy array in the same order as the trackers.
+
+	"""
+	def __init__(self, workers=4, minPerWorker=4):
+		# store the number of worker threads and the minimum number of
+		# trackers a worker should get before the work is split at all
+		self.workers = max(1, workers)
+		self.minPerWorker = minPerWorker
+		self.executor = None
+		if self.workers > 1:
+			self.executor = ThreadPoolExecutor(max_workers=self.workers,
+				thread_name_prefix="tracker")
+
+	def _update(self, trackers, image, boxes, psrs, start, end):
+		# update a contiguous slice of the trackers and write their
+		# positions and peak-to-sidelobe ratios into the shared arrays
+		for i in range(start, end):
+			tracker = trackers[i]
+			psrs[i] = tracker.update(image)
+			pos = tracker.get_position()
+			boxes[i] = (pos.left(), pos.top(), pos.right(), pos.bottom())
+
+	def update(self, trackers, image):
+		n = len(trackers)
+		boxes = np.empty((n, 4), dtype="float32")
+		psrs = np.empty((n,), dtype="float32")
+
+		# split the trackers in as many contiguous chunks as there are
+		# workers (but never in chunks smaller than minPerWorker)
+		chunks = min(self.workers, max(1, n // self.minPerWorker))
+		if self.executor is None or chunks == 1:
+			self._update(trackers, image, boxes, psrs, 0, n)
+			return (boxes, psrs)
+
+		bounds = np.linspace(0, n, chunks + 1).astype("int")
+		futures = [self.executor.submit(self._update, trackers, image,
+			boxes, psrs, bounds[i], bounds[i + 1]) for i in range(chunks)]
+		for future in futures:
+			future.result()
+
+		return (boxes, psrs)
+
+	def shutdown(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=True)
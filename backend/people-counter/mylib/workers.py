@@ -0,0 +1,154 @@
+# import the necessary packages
+import multiprocessing
+import threading
+import queue
+import time
+
+class CameraWorker:
+
+	"""
+	Runs the pipeline of one camera in its own process, so cameras do not
+	contend for one interpreter lock. The process publishes its results
+	as small (kind, payload) messages on a queue, which a listener thread
+	hands to the given handler in this process.
+
+	"""
+	def __init__(self, cameraID, target, args, handler):
+		# store the camera, the function the process runs (it gets the
+		# given arguments followed by the message queue and the stop
+		# event) and the handler of its messages
+		self.cameraID = cameraID
+		self.target = target
+		self.args = args
+		self.handler = handler
+
+		# spawned processes start from a clean interpreter instead of a
+		# fork of a process full of threads
+		self.ctx = multiprocessing.get_context("spawn")
+		self.stop = self.ctx.Event()
+		self.process = None
+		self.listener = None
+		self.started = 0.0
+		self.restarts = 0
+
+	def start(self):
+		# start the process along with the thread relaying its messages
+		messages = self.ctx.Queue(maxsize=1000)
+		self.process = self.ctx.Process(target=self.target, args=self.args + (messages, self.stop),
+			name="camera-{}".format(self.cameraID), daemon=True)
+		self.process.start()
+		self.started = time.time()
+		self.listener = threading.Thread(target=self._listen, args=(messages, self.process),
+			name="listener-{}".format(self.cameraID), daemon=True)
+		self.listener.start()
+		return self
+
+	def _listen(self, messages, process):
+		# relay the messages until the process is gone and its queue is
+		# drained
+		while True:
+			try:
+				(kind, payload) = messages.get(timeout=0.5)
+			except queue.Empty:
+				if not process.is_alive():
+					break
+				continue
+			self.handler(self.cameraID, kind, payload)
+
+	def alive(self):
+		return self.process is not None and self.process.is_alive()
+
+	def crashed(self):
+		# a process that ended on its own with an error (a camera whose
+		# video file ended exits cleanly and is not restarted)
+		return (self.process is not None and not self.alive()
+			and self.process.exitcode != 0 and not self.stop.is_set())
+
+	def shutdown(self, timeout=10.0):
+		# ask the process to stop and kill it if it does not
+		self.stop.set()
+		if self.process is not None:
+			self.process.join(timeout)
+			if self.process.is_alive():
+				self.process.terminate()
+				self.process.join()
+		if self.listener is not None:
+			self.listener.join(timeout)
+
+class WorkerSupervisor:
+
+	"""
+	Watches the camera worker processes and restarts the ones that
+	crashed, waiting longer (up to maxBackoff) every time a worker
+	crashes again shortly after it was restarted.
+
+	"""
+	def __init__(self, interval=1.0, minBackoff=1.0, maxBackoff=60.0, onRestart=None):
+		# store how often the workers are checked, the restart backoff
+		# and an optional callback run before a worker is restarted
+		self.interval = interval
+		self.minBackoff = minBackoff
+		self.maxBackoff = maxBackoff
+		self.onRestart = onRestart
+
+		self.workers = {}
+		self.backoff = {}
+		self.retryAt = {}
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self._watch, name="supervisor", daemon=True)
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def add(self, worker):
+		with self.lock:
+			self.workers[worker.cameraID] = worker.start()
+			self.backoff[worker.cameraID] = self.minBackoff
+
+	def remove(self, cameraID):
+		with self.lock:
+			worker = self.workers.pop(cameraID, None)
+			self.backoff.pop(cameraID, None)
+			self.retryAt.pop(cameraID, None)
+		if worker is not None:
+			worker.shutdown()
+
+	def _watch(self):
+		while not self.stopped.wait(self.interval):
+			with self.lock:
+				for (cameraID, worker) in self.workers.items():
+					if not worker.crashed():
+						continue
+
+					# schedule the restart, backing off if the worker did not
+					# last long after the previous one
+					now = time.time()
+					if cameraID not in self.retryAt:
+						if now - worker.started > self.maxBackoff:
+							self.backoff[cameraID] = self.minBackoff
+						self.retryAt[cameraID] = now + self.backoff[cameraID]
+						self.backoff[cameraID] = min(self.backoff[cameraID] * 2, self.maxBackoff)
+						continue
+					if now < self.retryAt[cameraID]:
+						continue
+
+					del self.retryAt[cameraID]
+					if self.onRestart is not None:
+						self.onRestart(cameraID)
+					worker.restarts += 1
+					worker.start()
+
+	def stop(self):
+		# stop watching and shut every worker down
+		self.stopped.set()
+		for cameraID in list(self.workers):
+			self.remove(cameraID)
+
+	def get_stats(self):
+		with self.lock:
+			return {cameraID: {"pid": w.process.pid if w.process is not None else None,
+				"alive": w.alive(), "restarts": w.restarts,
+				"exitcode": w.process.exitcode if w.process is not None else None}
+				for (cameraID, w) in self.workers.items()}
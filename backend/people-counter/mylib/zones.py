@@ -0,0 +1,97 @@
+# import the necessary packages
+import time
+import numpy as np
+import cv2
+
+class ZoneMap:
+
+	"""
+	Live occupancy of polygon zones (queues, seating areas, ...) of one
+	camera. The polygons are rasterized once into a label mask at the
+	processing resolution, so every frame each track centroid is
+	resolved to its zone with a single array lookup. Besides the number
+	of people in every zone it keeps how long they have been there and
+	the mean dwell time of the visits that ended.
+
+	"""
+	def __init__(self, zones, W, H):
+		# store the names of the zones and rasterize their polygons,
+		# given as fractions of the frame, into the label mask (0 means
+		# no zone, a later zone wins where two overlap)
+		self.names = []
+		self.polygons = []
+		self.mask = np.zeros((H, W), dtype="uint8")
+		for (i, zone) in enumerate(zones[:255]):
+			points = (np.asarray(zone["points"], dtype="float") * [W, H]).round().astype("int32")
+			self.names.append(zone.get("name", "zone{}".format(i)))
+			self.polygons.append(points)
+			cv2.fillPoly(self.mask, [points], i + 1)
+
+		# the zone (label) of every track and the time it entered it,
+		# sorted by ID
+		self.ids = np.zeros((0,), dtype="int")
+		self.labels = np.zeros((0,), dtype="uint8")
+		self.since = np.zeros((0,), dtype="float")
+
+		# the number of finished visits and their total dwell time per
+		# zone (index 0 is outside every zone)
+		self.visits = np.zeros(len(self.names) + 1, dtype="int")
+		self.dwell = np.zeros(len(self.names) + 1, dtype="float")
+		self.now = time.time()
+
+	def update(self, ids, centroids, now=None):
+		# look up the zone of every centroid in the label mask
+		self.now = time.time() if now is None else now
+		ids = np.asarray(ids, dtype="int")
+		pts = np.asarray(centroids, dtype="int").reshape(-1, 2)
+		(H, W) = self.mask.shape
+		x = np.clip(pts[:, 0], 0, W - 1)
+		y = np.clip(pts[:, 1], 0, H - 1)
+		labels = self.mask[y, x]
+
+		# find the previous zone of every track, tracks that are new or
+		# changed zone (re)start their dwell time
+		since = np.full(len(ids), self.now)
+		if len(self.ids) > 0:
+			idx = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+			stay = (self.ids[idx] == ids) & (self.labels[idx] == labels)
+			since[stay] = self.since[idx[stay]]
+
+			# the visits of the tracks that left their zone or are gone
+			ended = np.ones(len(self.ids), dtype="bool")
+			ended[idx[stay]] = False
+			ended &= self.labels > 0
+			self.visits += np.bincount(self.labels[ended], minlength=len(self.visits))
+			self.dwell += np.bincount(self.labels[ended],
+				weights=self.now - self.since[ended], minlength=len(self.dwell))
+
+		# store the current zones sorted by ID for the next frame
+		order = np.argsort(ids, kind="stable")
+		(self.ids, self.labels, self.since) = (ids[order], labels[order], since[order])
+		return labels
+
+	def draw(self, frame, color=(255, 255, 0)):
+		# outline every zone along with its name and occupancy
+		occupancy = np.bincount(self.labels, minlength=len(self.names) + 1)
+		for (i, (name, points)) in enumerate(zip(self.names, self.polygons)):
+			cv2.polylines(frame, [points], True, color, 2)
+			(x, y) = points[0]
+			cv2.putText(frame, "{}: {}".format(name, occupancy[i + 1]), (int(x) + 5, int(y) + 15),
+				cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+	def get_stats(self):
+		# the occupancy of every zone, the longest and mean dwell time of
+		# the people in it and the mean dwell time of finished visits
+		n = len(self.visits)
+		occupancy = np.bincount(self.labels, minlength=n)
+		current = self.now - self.since
+		longest = np.zeros(n)
+		np.maximum.at(longest, self.labels, current)
+		total = np.bincount(self.labels, weights=current, minlength=n)
+
+		return {name: {"occupancy": int(occupancy[i]),
+			"dwell_max_s": round(float(longest[i]), 1),
+			"dwell_mean_s": round(float(total[i] / occupancy[i]), 1) if occupancy[i] else 0.0,
+			"visits": int(self.visits[i]),
+			"visit_mean_s": round(float(self.dwell[i] / self.visits[i]), 1) if self.visits[i] else 0.0}
+			for (i, name) in enumerate(self.names, start=1)}
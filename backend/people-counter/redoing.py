@@ -1,21 +1,36 @@
 import signal
 import sys
+import os
 import threading
 import base64
+from queue import Full
 from mylib.centroidtracker import CentroidTracker
-from mylib.trackableobject import TrackableObject
-from imutils.video import VideoStream
+from mylib.linecounter import CountingLines
+from mylib.zones import ZoneMap
+from mylib.flowcounter import FlowCounter
+from mylib.detector import DetectorService, BACKENDS
+from mylib.postprocess import decode_detections
+from mylib.motion import MotionGate
+from mylib.scheduler import DetectionScheduler, PhaseAssigner, RemotePhase, PhaseFollower
+from mylib.roi import DetectionRegion
+from mylib.tiling import TileGrid
+from mylib.framepipeline import FramePipeline
+from mylib.trackerpool import TrackerPool
+from mylib.trackerengine import make_engine, UpdateBudget
+from mylib.capture import Capture, probe
+from mylib.framering import SharedFrameRing
+from mylib.workers import CameraWorker, WorkerSupervisor
+from mylib.jpegcache import JpegCache
+from mylib.feedmeter import FeedMeter
 from imutils.video import FPS
 from mylib.mailer import Mailer
-from mylib import config, thread
 import time, schedule, csv
-import numpy as np
-import argparse, imutils
-import time, dlib, cv2, datetime
+import argparse
+import time, cv2, datetime
 from itertools import zip_longest
 from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, Namespace
+from flask_socketio import SocketIO, emit, Namespace, join_room, leave_room
 import logging
 
 app = Flask(__name__)
@@ -25,11 +40,27 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 class VideoNamespace(Namespace):
     def on_connect(self):
         print('Client connected')
+        # Clients get base64 frames until they ask for binary ones
+        join_room('base64')
+        feed_meter.join(request.sid, 'base64')
         # Emit the initial counts to the connected client
         emit('count', {'count': halls})
 
+    def on_video_format(self, data):
+        # A client picks the format of its video frames, "binary" frames
+        # come as 'video_frame' events with the JPEG as an attachment
+        fmt = (data or {}).get('format')
+        if fmt not in FeedMeter.FORMATS:
+            return {'error': 'Unknown format'}
+        for room in FeedMeter.FORMATS:
+            leave_room(room)
+        join_room(fmt)
+        feed_meter.join(request.sid, fmt)
+        return {'format': fmt}
+
     def on_disconnect(self):
         print('Client disconnected')
+        feed_meter.leave(request.sid)
 
 # Use the custom namespace when creating the Socket.IO instance
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', namespace='/video')
@@ -41,6 +72,7 @@ output_frames = {}
 camera_threads = {}
 stop_events = {}
 counters = {}
+camera_stats = {}
 
 # Global structure to store counts for each camera
 counts = {
@@ -51,159 +83,535 @@ counts = {
 
 halls = {}
 
-def run_camera(camera_id, url):
-    global output_frames, counts
+# Occupancy and dwell times of the polygon zones of each camera
+zones = {}
+
+# The latest frame of each camera, encoded once and shared by every viewer
+frame_cache = JpegCache()
+
+# The Socket.IO video viewers, with the bandwidth and CPU time they cost
+feed_meter = FeedMeter()
+
+# Command line arguments and the detector service shared by every camera
+args = None
+detector = None
+
+# Detection slots of all cameras, spread evenly across the interval
+phases = PhaseAssigner()
+
+# Worker threads shared by every camera to update the dlib trackers
+tracker_pool = None
+
+# The longest detection interval of a camera using the Kalman engine
+KALMAN_MAX_INTERVAL = 10
+
+# With --execution process every camera runs in a supervised worker process,
+# the counts it had reached before a restart are carried over
+supervisor = None
+count_offsets = {}
+frame_rings = {}
+
+def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("-p", "--prototxt", required=False, default="./mobilenet_ssd/MobileNetSSD_deploy.prototxt",
                     help="path to Caffe 'deploy' prototxt file")
     ap.add_argument("-m", "--model", required=False, default="./mobilenet_ssd/MobileNetSSD_deploy.caffemodel",
-                    help="path to Caffe pre-trained model")
+                    help="path to Caffe pre-trained model or ONNX model")
     ap.add_argument("-c", "--confidence", type=float, default=0.4,
                     help="minimum probability to filter weak detections")
+    ap.add_argument("-n", "--nms", type=float, default=None,
+                    help="optional overlap threshold for non-maximum suppression")
     ap.add_argument("-s", "--skip-frames", type=int, default=30,
-                    help="# of skip frames between detections")
-    args = vars(ap.parse_args())
+                    help="base # of skip frames between detections")
+    ap.add_argument("-k", "--backend", default="auto", choices=["auto"] + list(BACKENDS),
+                    help="OpenCV DNN backend, 'auto' benchmarks them on example.png")
+    ap.add_argument("-t", "--tracker-workers", type=int, default=min(4, os.cpu_count() or 1),
+                    help="# of threads updating the dlib trackers of a frame")
+    ap.add_argument("-b", "--batch-size", type=int, default=1,
+                    help="max # of camera frames per detector forward pass")
+    ap.add_argument("-w", "--batch-wait", type=float, default=10.0,
+                    help="max milliseconds a frame waits for a batch to fill")
+    ap.add_argument("-x", "--execution", choices=["thread", "process"], default="thread",
+                    help="run every camera on a thread of this process or in its own process")
+    return vars(ap.parse_args())
+
+def make_motion_gate(options):
+    # motion gating is on by default and can be tuned or disabled per camera
+    # with a "motion" object in the /add_camera request
+    motion = options.get("motion") or {}
+    if not motion.get("enabled", True):
+        return None
+    return MotionGate(threshold=motion.get("threshold", 25),
+                      holdFrames=motion.get("hold_frames", 60),
+                      band=motion.get("band"))
+
+def make_scheduler(camera_id, options):
+    # the detection interval adapts around --skip-frames unless a camera
+    # asks for a fixed one with {"scheduler": {"adaptive": false}}
+    scheduler = options.get("scheduler") or {}
+    baseInterval = args["skip_frames"]
+    maxInterval = scheduler.get("max_interval", 3 * baseInterval)
+
+    # the Kalman engine only extrapolates between detections and has no drift
+    # signal, and its counts fall apart beyond ~10 frames, so it is capped there
+    if options.get("tracker") == "kalman":
+        baseInterval = min(baseInterval, KALMAN_MAX_INTERVAL)
+        maxInterval = min(maxInterval, KALMAN_MAX_INTERVAL)
+    return DetectionScheduler(camera_id, baseInterval=baseInterval,
+                              minInterval=scheduler.get("min_interval", 5),
+                              maxInterval=maxInterval,
+                              adaptive=scheduler.get("adaptive", True))
+
+def make_region(options):
+    # by default the detector sees the whole frame, a camera can restrict it
+    # to {"roi": {"band": 0.25}} around its counting lines or to a polygon
+    # {"roi": {"polygon": [[x, y], ...]}} given as fractions of the frame
+    roi = options.get("roi") or {}
+    return DetectionRegion(band=roi.get("band"), polygon=roi.get("polygon"))
+
+def make_tiles(options):
+    # wide-angle cameras can detect on overlapping tiles of the full
+    # resolution frame with {"tiles": {"cols": 3, "rows": 2, "overlap": 0.2}}
+    tiles = options.get("tiles")
+    if not tiles:
+        return None
+    return TileGrid(cols=tiles.get("cols", 2), rows=tiles.get("rows", 2),
+                    overlap=tiles.get("overlap", 0.2))
+
+def make_pipeline(options):
+    # the detector, tracker and display resolutions can be chosen per camera
+    # with {"pipeline": {"detector_width": 300, "tracker_scale": 0.5,
+    # "tracker_gray": true, "display_width": 320}}
+    pipeline = options.get("pipeline") or {}
+    return FramePipeline(width=500, detectorWidth=pipeline.get("detector_width"),
+                         trackerScale=pipeline.get("tracker_scale", 1.0),
+                         trackerGray=pipeline.get("tracker_gray", False),
+                         displayWidth=pipeline.get("display_width"))
+
+def make_centroid_tracker(options):
+    # people are matched greedily by default, crowded cameras can ask for
+    # the optimal assignment with {"centroid": {"matching": "hungarian"}}
+    # and move the object count above which the grid index is used with
+    # "grid_threshold" (null keeps the full distance matrix)
+    centroid = options.get("centroid") or {}
+    return CentroidTracker(maxDisappeared=centroid.get("max_disappeared", 40),
+                           maxDistance=centroid.get("max_distance", 50),
+                           matching=centroid.get("matching", "greedy"),
+                           gridThreshold=centroid.get("grid_threshold", 400))
+
+def make_counting_lines(options, W, H):
+    # people are counted on a horizontal line through the middle of the frame
+    # unless a camera gives its own lines or polylines as fractions of the
+    # frame, e.g. {"lines": [{"name": "door", "points": [[0.2, 0.9], [0.7, 0.4]]}]},
+    # walking to the left-hand side of a line (seen from its first point) is "in",
+    # once a person is {"line_margin": 8} pixels past it
+    return CountingLines(options.get("lines"), W, H, margin=options.get("line_margin", 8))
+
+def make_zone_map(options, W, H):
+    # cameras can report the occupancy of areas of the view with
+    # {"zones": [{"name": "queue", "points": [[x, y], ...]}, ...]} given as
+    # fractions of the frame
+    if not options.get("zones"):
+        return None
+    return ZoneMap(options["zones"], W, H)
+
+def make_budget(options):
+    # every dlib tracker runs on every frame unless a camera lets the ones
+    # far from its lines and zones skip frames with {"lazy": {"every": 3,
+    # "near": 40, "min_speed": 2.0}} (distances in processing pixels)
+    lazy = options.get("lazy")
+    if not lazy:
+        return None
+    return UpdateBudget(every=lazy.get("every", 3), nearDistance=lazy.get("near", 40),
+                        minSpeed=lazy.get("min_speed", 2.0))
+
+def make_flow_counter(options, lines, W, H):
+    # crowded cameras can switch to counting from the optical flow across
+    # their lines once the detector sees too many people to track with
+    # {"crowd": {"enter_at": 40, "leave_at": 25, "calibrate_from": 10}}
+    crowd = options.get("crowd")
+    if not crowd:
+        return None
+    return FlowCounter(lines.polylines, W, H, band=crowd.get("band", 10),
+                       enterAt=crowd.get("enter_at", 40), leaveAt=crowd.get("leave_at", 25))
+
+def make_capture(url, options):
+    # every camera is read on its own thread that keeps only the newest frame,
+    # a small ring can be asked for with {"capture": {"slots": 4}} and the
+    # frames converted for the pipeline capped with {"capture": {"target_fps": 10}}
+    capture = options.get("capture") or {}
+    return Capture(url, slots=capture.get("slots", 1),
+                   reconnect=capture.get("reconnect", True),
+                   targetFps=capture.get("target_fps")).start()
+
+class LocalSink:
+    # publishes the results of a camera pipeline to the clients of this process
+
+    def stats(self, camera_id, stats):
+        camera_stats[camera_id] = dict(stats, video=frame_cache.slot(camera_id).get_stats())
+
+    def counts(self, camera_id, entered, exited):
+        (baseIn, baseOut) = count_offsets.get(camera_id, (0, 0))
+        counts["entered"][camera_id] = entered + baseIn
+        counts["exited"][camera_id] = exited + baseOut
+        counts["inside"][camera_id] = counts["entered"][camera_id] - counts["exited"][camera_id]
 
-    CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat", "bottle", "bus", "car", "cat", "chair", "cow",
-               "diningtable", "dog", "horse", "motorbike", "person", "pottedplant", "sheep", "sofa", "train", "tvmonitor"]
+        # Update hall counts
+        for hall_id, hall_data in halls.items():
+            if camera_id in hall_data["entered"]:
+                halls[hall_id]["entered"][camera_id] = counts["entered"][camera_id]
+                halls[hall_id]["exited"][camera_id] = counts["exited"][camera_id]
+                halls[hall_id]["inside"][camera_id] = counts["inside"][camera_id]
+
+        # Emit the updated hall counts within the namespace
+        socketio.emit('count', {'count': halls}, namespace='/video')
 
-    net = cv2.dnn.readNetFromCaffe(args["prototxt"], args["model"])
+    def crossing(self, camera_id, events):
+        socketio.emit('crossing', {'camera_id': camera_id, 'events': events}, namespace='/video')
+
+    def zones(self, camera_id, stats):
+        zones[camera_id] = stats
+        socketio.emit('zones', {'camera_id': camera_id, 'zones': stats}, namespace='/video')
+
+    def frame(self, camera_id, image):
+        # the pipeline reuses its frame buffers, so the frame is encoded
+        # right away; the MJPEG and snapshot viewers share the same JPEG
+        frame_cache.publish(camera_id, image, encode=True)
+        (seq, timestamp, data) = frame_cache.get(camera_id)
+
+        # binary viewers get the JPEG as an attachment with a small header
+        viewers = feed_meter.count('binary')
+        if viewers:
+            start = time.thread_time()
+            socketio.emit('video_frame', {'camera_id': camera_id, 'seq': seq, 'timestamp': timestamp,
+                                          'frame': data}, namespace='/video', room='binary')
+            feed_meter.record('binary', len(data), viewers, time.thread_time() - start)
+
+        # older clients still get it base64 encoded in JSON
+        viewers = feed_meter.count('base64')
+        if viewers:
+            start = time.thread_time()
+            b_frame = base64.b64encode(data).decode('utf-8')
+            socketio.emit('video_feed', {'camera_id': camera_id, 'frame': b_frame},
+                          namespace='/video', room='base64')
+            feed_meter.record('base64', len(b_frame), viewers, time.thread_time() - start)
+
+    def close(self):
+        pass
+
+class QueueSink:
+    # publishes the results of a camera pipeline running in a worker process:
+    # display frames go through a shared memory ring, everything else is sent
+    # as small messages (stats and zones at most once a second)
+
+    def __init__(self, queue, interval=1.0):
+        self.queue = queue
+        self.interval = interval
+        self.ring = None
+        self.last = {}
+        self.sent = {}
+
+    def _put(self, kind, payload, throttle=False, drop=False):
+        # returns whether the message was sent, a full queue (the main process
+        # is falling behind) drops it
+        now = time.time()
+        if throttle and now - self.sent.get(kind, 0.0) < self.interval:
+            return False
+        try:
+            self.queue.put((kind, payload), block=not drop, timeout=1.0)
+        except Full:
+            return False
+        self.sent[kind] = now
+        return True
+
+    def stats(self, camera_id, stats):
+        self._put("stats", stats, throttle=True)
+
+    def counts(self, camera_id, entered, exited):
+        # only changes are sent, a dropped change is sent again next frame
+        if self.last.get("counts") != (entered, exited) and self._put("counts", (entered, exited)):
+            self.last["counts"] = (entered, exited)
+
+    def crossing(self, camera_id, events):
+        self._put("crossing", events)
+
+    def zones(self, camera_id, stats):
+        self._put("zones", stats, throttle=True)
+
+    def frame(self, camera_id, image):
+        # (re)create the ring when the display size changes, then only the
+        # sequence number of the frame is sent
+        if self.ring is None or self.ring.shape != image.shape:
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = SharedFrameRing(image.shape)
+            self._put("ring", (self.ring.name, image.shape))
+        self._put("frame", self.ring.write(image), drop=True)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+
+def handle_worker_message(camera_id, kind, payload):
+    # apply what a camera worker process published as if the camera ran here
+    sink = LocalSink()
+    if kind == "counts":
+        sink.counts(camera_id, *payload)
+    elif kind == "crossing":
+        sink.crossing(camera_id, payload)
+    elif kind == "zones":
+        sink.zones(camera_id, payload)
+    elif kind == "stats":
+        sink.stats(camera_id, dict(payload, worker=supervisor.get_stats().get(camera_id)))
+    elif kind == "ring":
+        (name, shape) = payload
+        old = frame_rings.pop(camera_id, None)
+        if old is not None:
+            old.close()
+        frame_rings[camera_id] = SharedFrameRing(shape, name=name, create=False)
+    elif kind == "frame" and camera_id in frame_rings:
+        frame = frame_rings[camera_id].read(payload)
+        if frame is not None:
+            sink.frame(camera_id, frame[0])
+
+def carry_counts(camera_id):
+    # a restarted worker counts from zero again, so keep what it had reached
+    count_offsets[camera_id] = (counts["entered"].get(camera_id, 0),
+                                counts["exited"].get(camera_id, 0))
+
+    # a crashed (or killed) worker never removed its frame ring
+    ring = frame_rings.pop(camera_id, None)
+    if ring is not None:
+        ring.close(unlink=True)
+
+def camera_process(camera_id, url, options, host_args, phase, queue, stop):
+    # the entry point of a camera worker process: it gets its own detector and
+    # tracker pool, publishes through the queue and follows the detection
+    # phase the main process assigns it
+    global args, detector, tracker_pool, phases
+    args = host_args
+    phases = PhaseFollower(phase)
+    detector = DetectorService(args["prototxt"], args["model"], backend=args["backend"]).start()
+    tracker_pool = TrackerPool(args["tracker_workers"])
+    sink = QueueSink(queue)
+    try:
+        run_camera(camera_id, url, options, sink, stop)
+    finally:
+        sink.close()
+        detector.stop()
+        tracker_pool.shutdown()
 
-    vs = VideoStream(url).start()
-    time.sleep(2.0)
+def run_camera(camera_id, url, options=None, sink=None, stop=None):
+    global output_frames, counts
+    options = options or {}
+    sink = sink or LocalSink()
+    stop = stop or stop_events[camera_id]
 
     writer = None
     W = None
     H = None
 
-    ct = CentroidTracker(maxDisappeared=40, maxDistance=50)
-    trackers = []
-    trackableObjects = {}
+    ct = make_centroid_tracker(options)
+    rects = []
+    lines = None
+    zoneMap = None
+    flow = None
+    crowd = False
 
     totalFrames = 0
     totalDown = 0
     totalUp = 0
 
+    gate = make_motion_gate(options)
+    scheduler = make_scheduler(camera_id, options)
+    region = make_region(options)
+    tiles = make_tiles(options)
+    pipeline = make_pipeline(options)
+
+    # dlib correlation trackers by default, or {"tracker": "kalman"} for the
+    # motion-model engine that touches no pixels between detections
+    budget = make_budget(options)
+    engine = make_engine(options.get("tracker", "dlib"), tracker_pool, pipeline.trackerScale, budget)
+    idle = False
+    stats = {"frames": 0, "inferences": 0}
+
+    # the capture and the detection slot are given back however the loop
+    # ends, a camera that failed must not keep its source open or its phase
+    vs = make_capture(url, options)
+    phases.add(camera_id, scheduler)
     fps = FPS().start()
 
-    if config.Thread:
-        vs = thread.ThreadingClass(url)
-
-    while not stop_events[camera_id].is_set():
-        frame = vs.read()
-        frame = frame[1] if isinstance(vs, cv2.VideoCapture) else frame
-
-        if frame is None:
-            break
-
-        frame = imutils.resize(frame, width=500)
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        if W is None or H is None:
-            (H, W) = frame.shape[:2]
-
-        status = "Waiting"
-        rects = []
-
-        if totalFrames % args["skip_frames"] == 0:
-            status = "Detecting"
-            trackers = []
-
-            blob = cv2.dnn.blobFromImage(frame, 0.007843, (W, H), 127.5)
-            net.setInput(blob)
-            detections = net.forward()
-
-            for i in np.arange(0, detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-
-                if confidence > args["confidence"]:
-                    idx = int(detections[0, 0, i, 1])
-
-                    if CLASSES[idx] != "person":
-                        continue
-
-                    box = detections[0, 0, i, 3:7] * np.array([W, H, W, H])
-                    (startX, startY, endX, endY) = box.astype("int")
-
-                    tracker = dlib.correlation_tracker()
-                    rect = dlib.rectangle(startX, startY, endX, endY)
-                    tracker.start_track(rgb, rect)
-
-                    trackers.append(tracker)
-
-        else:
-            for tracker in trackers:
-                status = "Tracking"
-                tracker.update(rgb)
-                pos = tracker.get_position()
-
-                startX = int(pos.left())
-                startY = int(pos.top())
-                endX = int(pos.right())
-                endY = int(pos.bottom())
-
-                rects.append((startX, startY, endX, endY))
-
-        cv2.line(frame, (0, H // 2), (W, H // 2), (0, 0, 0), 3)
-        cv2.putText(frame, "-Prediction border - Entrance-", (10, H - 20),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
-
-        objects = ct.update(rects)
-
-        for (objectID, centroid) in objects.items():
-            to = trackableObjects.get(objectID, None)
+    try:
+        while not stop.is_set():
+            # wait for the newest frame, while a live source reconnects the loop
+            # just keeps checking for the stop event
+            captured = vs.read(timeout=1.0)
+            if captured is None:
+                if not vs.running():
+                    break
+                continue
+            frame = captured.image
+
+            # only the resized processing frame is produced here, the tracker image
+            # is converted on the frames that run the detector or the trackers
+            raw = frame
+            frame = pipeline.process(raw)
+
+            if W is None or H is None:
+                (H, W) = frame.shape[:2]
+                lines = make_counting_lines(options, W, H)
+                zoneMap = make_zone_map(options, W, H)
+                flow = make_flow_counter(options, lines, W, H)
+                region.set_lines(lines.polylines)
+                if gate is not None:
+                    gate.set_lines(lines.polylines, W, H)
+                if budget is not None:
+                    budget.set_boundaries(W, H, lines.polylines,
+                                          zoneMap.polygons if zoneMap is not None else ())
+
+            status = "Waiting"
+            detect = scheduler.should_detect()
+
+            # skip the detector and the trackers while nothing moves in the scene,
+            # keeping the last tracked boxes so objects are not marked as gone, and
+            # detect straight away once motion starts again
+            wasIdle = idle
+            idle = gate is not None and not gate.update(frame)
+            detect = detect or (wasIdle and not idle)
+
+            if idle:
+                status = "Idle"
+                # every detection slot that falls on an idle frame is one
+                # inference saved, after which the next slot is an interval away
+                if detect:
+                    scheduler.skipped()
+                    gate.inferencesSaved += 1
+
+            elif detect:
+                status = "Detecting"
+                stats["inferences"] += 1
+                scheduler.detected()
+
+                if tiles is not None:
+                    # detect on all tiles of the full resolution frame in one batch
+                    start = time.time()
+                    detections = detector.detect_many(camera_id, tiles.split(raw))
+                    boxes = tiles.merge(detections, W / float(raw.shape[1]), args["confidence"],
+                                        overlapThresh=args["nms"] or 0.3)
+                    tiles.record("tiled", time.time() - start)
+
+                    # every 50th time, also time a single-shot detection to compare
+                    if scheduler.detections % 50 == 1:
+                        start = time.time()
+                        detector.detect(camera_id, frame)
+                        tiles.record("single", time.time() - start)
+
+                else:
+                    crop = region.crop(frame)
+                    detections = detector.detect(camera_id, pipeline.detector_image(crop))
+
+                    boxes = decode_detections(detections, crop.shape[1], crop.shape[0],
+                                              args["confidence"], overlapThresh=args["nms"])
+                    boxes = region.to_frame(boxes)
+
+                # in a crowd the detector only tells when it thins out again, the
+                # trackers are dropped and people are counted from the flow
+                if flow is not None:
+                    crowd = flow.observe(len(boxes))
+                rects = engine.detect(boxes if not crowd else [], pipeline)
+                if crowd:
+                    scheduler.hold("crowd")
+                else:
+                    scheduler.update(boxes, [], lines, H)
+
+            elif crowd:
+                status = "Crowd"
+                rects = []
 
-            if to is None:
-                to = TrackableObject(objectID, centroid)
             else:
-                y = [c[1] for c in to.centroids]
-                direction = centroid[1] - np.mean(y)
-                to.centroids.append(centroid)
-
-                if not to.counted:
-                    if direction < 0 and centroid[1] < H // 2:
-                        totalUp += 1
-                        to.counted = True
-
-                    elif direction > 0 and centroid[1] > H // 2:
-                        totalDown += 1
-                        to.counted = True
-
-            trackableObjects[objectID] = to
-
-            text = "ID {}".format(objectID)
-            cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-            cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 0, 255), -1)
-
-        counts["entered"][camera_id] = totalDown
-        counts["exited"][camera_id] = totalUp
-        counts["inside"][camera_id] = totalDown - totalUp
-
-        # Update hall counts
-        for hall_id, hall_data in halls.items():
-            if camera_id in hall_data["entered"]:
-                halls[hall_id]["entered"][camera_id] = counts["entered"][camera_id]
-                halls[hall_id]["exited"][camera_id] = counts["exited"][camera_id]
-                halls[hall_id]["inside"][camera_id] = counts["inside"][camera_id]
-
-        if writer is not None:
-            writer.write(frame)
-
-        _, buffer = cv2.imencode('.jpg', frame)
-        b_frame = base64.b64encode(buffer).decode('utf-8')
-        socketio.emit('video_feed', {'camera_id': camera_id, 'frame': b_frame}, namespace='/video')
-
-        # Emit the updated hall counts within the namespace
-        socketio.emit('count', {'count': halls}, namespace='/video')
-
-        key = cv2.waitKey(1) & 0xFF
-
-        if key == ord("q"):
-            break
-
-        totalFrames += 1
-        fps.update()
+                if len(engine) > 0:
+                    status = "Tracking"
+                (rects, psrs) = engine.track(pipeline)
+                scheduler.update(rects, psrs, lines, H)
+
+            # test the movement of every track against every counting line at once
+            ct.update(rects)
+            (objectIDs, centroids) = ct.tracks()
+            events = lines.update(objectIDs, centroids)
+            (totalDown, totalUp) = lines.totals()
+
+            # measure the flow across the lines in a crowd, and while enough
+            # people are tracked to calibrate the area of a person against them
+            if flow is not None:
+                if crowd or len(engine) >= options["crowd"].get("calibrate_from", 10):
+                    (inArea, outArea) = flow.measure(frame)
+                    if crowd:
+                        flow.add(inArea, outArea)
+                    else:
+                        flow.calibrate(inArea, outArea,
+                                       sum(e["direction"] == "in" for e in events),
+                                       sum(e["direction"] == "out" for e in events))
+                else:
+                    flow.skip()
+
+                (flowIn, flowOut) = flow.totals()
+                totalDown += flowIn
+                totalUp += flowOut
+
+            # the lines are drawn once the flow band has been measured
+            lines.draw(frame)
+            cv2.putText(frame, "-Prediction border - Entrance-", (10, H - 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+
+            if events:
+                sink.crossing(camera_id, events)
+
+            # resolve every track to its zone with one lookup in the label mask
+            if zoneMap is not None:
+                zoneMap.update(objectIDs, centroids)
+                zoneMap.draw(frame)
+                sink.zones(camera_id, zoneMap.get_stats())
+
+            for (objectID, centroid) in zip(objectIDs, centroids):
+                text = "ID {}".format(objectID)
+                cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+                cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 0, 255), -1)
+
+            sink.counts(camera_id, totalDown, totalUp)
+
+            if writer is not None:
+                writer.write(frame)
+
+            # idle frames barely change, so only every 10th one is encoded and sent
+            if not idle or totalFrames % 10 == 0:
+                sink.frame(camera_id, pipeline.display_image(frame))
+
+            key = cv2.waitKey(1) & 0xFF
+
+            if key == ord("q"):
+                break
+
+            totalFrames += 1
+            stats["frames"] = totalFrames
+            stats["scheduler"] = scheduler.get_stats()
+            stats["roi"] = region.get_stats()
+            stats["pipeline"] = pipeline.get_stats()
+            stats["tracker"] = engine.get_stats()
+            stats["lines"] = lines.get_stats()
+            if flow is not None:
+                stats["crowd"] = flow.get_stats()
+            if tiles is not None:
+                stats["tiles"] = tiles.get_stats()
+            if gate is not None:
+                stats["motion"] = gate.get_stats()
+            stats["capture"] = dict(vs.get_stats(),
+                                    latency_ms=round((time.time() - captured.timestamp) * 1000.0, 1))
+            sink.stats(camera_id, stats)
+            fps.update()
+    finally:
+        phases.remove(camera_id)
+        vs.stop()
 
     fps.stop()
     print("[INFO] elapsed time: {:.2f}".format(fps.elapsed()))
@@ -212,19 +620,11 @@ def run_camera(camera_id, url):
     if writer is not None:
         writer.release()
 
-    if isinstance(vs, VideoStream):
-        vs.stop()
-    elif isinstance(vs, thread.ThreadingClass):
-        vs.stop()
     cv2.destroyAllWindows()
 
 
 def is_valid_camera_link(camera_link):
-    cap = cv2.VideoCapture(camera_link)
-    if not cap.isOpened():
-        return False
-    cap.release()
-    return True
+    return probe(camera_link)
 
 @app.route('/add_camera', methods=['POST'])
 def add_camera():
@@ -237,7 +637,7 @@ def add_camera():
         if not camera_id or not camera_link or not hall_id:
             return jsonify({'error': 'Missing camera_id or camera_link'}), 400
 
-        if camera_id in camera_threads:
+        if camera_exists(camera_id):
             return jsonify({'error': 'Camera ID already exists'}), 400
 
         if not is_valid_camera_link(camera_link):
@@ -260,8 +660,21 @@ def add_camera():
         halls[hall_id]["exited"][camera_id] = 0
         halls[hall_id]["inside"][camera_id] = 0
 
+        # in process mode the camera gets a worker process of its own, which
+        # uses the detector backend already chosen here
+        if supervisor is not None:
+            count_offsets.pop(camera_id, None)
+            host_args = dict(args, backend=detector.backend)
+            # the detection phases are still spread across every camera here
+            remote = RemotePhase()
+            phases.add(camera_id, remote)
+            supervisor.add(CameraWorker(camera_id, camera_process,
+                                        (camera_id, camera_link, data, host_args, remote.value),
+                                        handle_worker_message))
+            return jsonify({'message': 'Camera added successfully'}), 200
+
         stop_events[camera_id] = threading.Event()
-        camera_thread = threading.Thread(target=run_camera, args=(camera_id, camera_link))
+        camera_thread = threading.Thread(target=run_camera, args=(camera_id, camera_link, data))
         camera_threads[camera_id] = camera_thread
         camera_thread.start()
 
@@ -279,23 +692,60 @@ def remove_camera():
     if not camera_id or not hall_id:
         return jsonify({'error': 'Missing camera_id'}), 400
 
-    if camera_id not in camera_threads:
+    if supervisor is not None and camera_id in supervisor.workers:
+        supervisor.remove(camera_id)
+        phases.remove(camera_id)
+        count_offsets.pop(camera_id, None)
+        ring = frame_rings.pop(camera_id, None)
+        if ring is not None:
+            ring.close(unlink=True)
+    elif camera_id in camera_threads:
+        stop_events[camera_id].set()
+        camera_threads[camera_id].join()
+
+        del camera_threads[camera_id]
+        del stop_events[camera_id]
+    else:
         return jsonify({'error': 'Camera ID does not exist'}), 400
 
-    stop_events[camera_id].set()
-    camera_threads[camera_id].join()
-
-    del camera_threads[camera_id]
-    del stop_events[camera_id]
     del counts["entered"][camera_id]
     del counts["exited"][camera_id]
     del counts["inside"][camera_id]
     del halls[hall_id]["entered"][camera_id]
     del halls[hall_id]["exited"][camera_id]
     del halls[hall_id]["inside"][camera_id]
+    camera_stats.pop(camera_id, None)
+    zones.pop(camera_id, None)
+    frame_cache.remove(camera_id)
+    detector.release(camera_id)
 
     return jsonify({'message': 'Camera removed successfully'}), 200
 
+def camera_exists(camera_id):
+    return camera_id in camera_threads or (supervisor is not None and camera_id in supervisor.workers)
+
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id):
+    if not camera_exists(camera_id):
+        return jsonify({'error': 'Camera ID does not exist'}), 404
+    return Response(frame_cache.stream(camera_id), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+@app.route('/snapshot/<camera_id>')
+def snapshot(camera_id):
+    # the cached JPEG of the latest frame, 304 if the client has it already
+    if not camera_exists(camera_id):
+        return jsonify({'error': 'Camera ID does not exist'}), 404
+    slot = frame_cache.slot(camera_id)
+    frame = slot.get()
+    if frame is None:
+        return jsonify({'error': 'No frame yet'}), 503
+    (version, timestamp, data) = frame
+    etag = slot.etag(version)
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(data, mimetype='image/jpeg',
+                    headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
 @app.route('/count', methods=['GET'])
 def get_count():
     global counts
@@ -306,5 +756,37 @@ def get_halls():
     global halls
     return jsonify(halls)
 
+@app.route('/zones', methods=['GET'])
+def get_zones():
+    return jsonify(zones)
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify(camera_stats)
+
+@app.route('/detector', methods=['GET'])
+def get_detector():
+    return jsonify({'backend': detector.get_backend(), 'batching': detector.get_batch_stats(),
+                    'cameras': detector.get_stats()})
+
+@app.route('/viewers', methods=['GET'])
+def get_viewers():
+    return jsonify(feed_meter.get_stats())
+
+@app.route('/workers', methods=['GET'])
+def get_workers():
+    return jsonify(supervisor.get_stats() if supervisor is not None else {})
+
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    args = parse_args()
+    detector = DetectorService(args["prototxt"], args["model"],
+                               batchSize=args["batch_size"], maxWait=args["batch_wait"],
+                               backend=args["backend"]).start()
+    tracker_pool = TrackerPool(args["tracker_workers"])
+    if args["execution"] == "process":
+        supervisor = WorkerSupervisor(onRestart=carry_counts).start()
+    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    if supervisor is not None:
+        supervisor.stop()
+    detector.stop()
+    tracker_pool.shutdown()
\ No newline at end of file
@@ -12,6 +12,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from mylib.centroidtracker import CentroidTracker
 from mylib.trackableobject import TrackableObject
+from mylib.postprocess import decode_detections
 import logging
 from datetime import datetime
 import csv
@@ -133,12 +134,6 @@ def log_event(hall_number, camera_id, event_type):
 
 
 def run_video_processing(camera_id, hall_id, video_source, update_counts):
-    CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
-               "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
-               "dog", "horse", "motorbike", "person", "pottedplant",
-               "sheep", "sofa", "train", "tvmonitor"]
-
-
     global output_frames, camera_trackers
 
     prototxt = "./mobilenet_ssd/MobileNetSSD_deploy.prototxt"
@@ -197,23 +192,14 @@ def run_video_processing(camera_id, hall_id, video_source, update_counts):
             net.setInput(blob)
             detections = net.forward()
 
-            for i in np.arange(0, detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-
-                if confidence > confidence_threshold:
-                    idx = int(detections[0, 0, i, 1])
+            boxes = decode_detections(detections, W, H, confidence_threshold)
 
-                    if CLASSES[idx]!= "person":
-                        continue
+            for (startX, startY, endX, endY) in boxes:
+                tracker = dlib.correlation_tracker()
+                rect = dlib.rectangle(int(startX), int(startY), int(endX), int(endY))
+                tracker.start_track(rgb, rect)
 
-                    box = detections[0, 0, i, 3:7] * np.array([W, H, W, H])
-                    (startX, startY, endX, endY) = box.astype("int")
-
-                    tracker = dlib.correlation_tracker()
-                    rect = dlib.rectangle(startX, startY, endX, endY)
-                    tracker.start_track(rgb, rect)
-
-                    trackers.append(tracker)
+                trackers.append(tracker)
         else:
             for tracker in trackers:
                 status = "Tracking"
@@ -235,6 +221,10 @@ def run_video_processing(camera_id, hall_id, video_source, update_counts):
 
         objects = ct.update(rects)
 
+        # forget the people the centroid tracker gave up on
+        for objectID in ct.deregistered:
+            trackableObjects.pop(objectID, None)
+
         for (objectID, centroid) in objects.items():
             to = trackableObjects.get(objectID, None)
 
@@ -242,9 +232,8 @@ def run_video_processing(camera_id, hall_id, video_source, update_counts):
 
                 to = TrackableObject(objectID, centroid)
             else:
-                y = [c[1] for c in to.centroids]
-                direction = centroid[1] - np.mean(y)
-                to.centroids.append(centroid)
+                direction = centroid[1] - to.meanY
+                to.append(centroid)
 
                 if not to.counted:
                     if direction < 0 and centroid[1] < H // 2:
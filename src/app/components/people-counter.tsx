@@ -251,15 +251,23 @@ const PeopleCounter = () => {
 
     socketRef.current.on("connect", () => {
       console.log("Connected to server");
+      // Ask for binary frames instead of base64 JSON
+      socketRef.current.emit("video_format", { format: "binary" });
     });
 
-    socketRef.current.on("video_feed", (data: any) => {
+    socketRef.current.on("video_frame", (data: any) => {
       const { camera_id, frame } = data;
       const image = document.getElementById(
         `camera-${camera_id}`
       ) as HTMLImageElement;
       if (image) {
-        image.src = `data:image/jpeg;base64,${frame}`;
+        const previous = image.src;
+        image.src = URL.createObjectURL(
+          new Blob([frame], { type: "image/jpeg" })
+        );
+        if (previous.startsWith("blob:")) {
+          URL.revokeObjectURL(previous);
+        }
       }
     });
 